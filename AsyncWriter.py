@@ -0,0 +1,79 @@
+import atexit
+import queue
+import threading
+
+_STOP = object()  # 线程结束标记
+
+
+class AsyncWriter:
+    """
+    有界的后台写出服务，用于图片编码和写文件。
+
+    submit() 把任务放入有界队列，由若干写出线程执行；队列满时 submit() 阻塞，形成背压，
+    避免推理远快于写盘时内存无限增长。flush() 等待已提交的任务全部完成，close() 在此基础上结束线程；
+    程序退出时会自动 close()，保证已提交的文件都写完。
+    """
+
+    def __init__(self, threads=2, max_pending=32):
+        self._queue = queue.Queue(maxsize=max(1, max_pending))
+        self._errors = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(max(1, threads))]
+        for t in self._threads:
+            t.start()
+        atexit.register(self.close)
+
+    def submit(self, fn, *args, on_done=None, **kwargs):
+        """
+        提交一个写出任务。on_done(error) 在任务结束后于写出线程中调用，成功时 error 为 None。
+        """
+        if self._closed:
+            raise RuntimeError("AsyncWriter is closed")
+        self._queue.put((fn, args, kwargs, on_done))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                fn, args, kwargs, on_done = item
+                error = None
+                try:
+                    fn(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                    with self._lock:
+                        self._errors.append(e)
+                if on_done:
+                    on_done(error)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """
+        等待已提交的任务全部完成，返回并清空期间出现的异常列表。
+        """
+        self._queue.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        return errors
+
+    def close(self):
+        if self._closed:
+            return []
+        errors = self.flush()
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+        atexit.unregister(self.close)
+        return errors
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
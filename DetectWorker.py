@@ -0,0 +1,150 @@
+import os
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from DiscPipeline import PipelineControl, detect_images, load_model, open_detection_cache
+from ResultStore import RESULTS_FILE, ResultStore, load_records
+from RunManifest import RunManifest, file_hash
+from StageTimer import format_report
+from TreeMain import main1, main2, crop_records
+
+
+class DetectWorker(QThread):
+    """
+    在后台线程中加载模型并执行检测，通过信号把进度和信息传回界面线程。
+    """
+    message_signal = pyqtSignal(str)
+    progress_signal = pyqtSignal(int, int)
+    finished_signal = pyqtSignal(dict)
+
+    def __init__(self, image_files, model_path, model=None, model_hash=None, batch_size=1, split=False, resume=True,
+                 fast_decode_size=None, render='full', tile=None, use_cache=False, cascade_size=None, backend='pytorch',
+                 export_files=False, parent=None):
+        super().__init__(parent)
+        self.image_files = list(image_files)
+        self.model_path = model_path
+        self.model = model
+        self.model_hash = model_hash
+        self.batch_size = batch_size
+        self.split = split
+        self.resume = resume
+        self.fast_decode_size = fast_decode_size
+        self.render = render
+        self.tile = tile
+        self.use_cache = use_cache
+        self.cascade_size = cascade_size
+        self.backend = backend
+        self.export_files = export_files  # 是否写出逐图 gen-txt/gen-xml，检测结果始终写入 results.jsonl
+        self.control = PipelineControl()
+
+    def run(self):
+        summary = {}
+        cache = None
+        try:
+            # 没有传入已加载的模型时在当前线程中加载
+            if self.model is None:
+                self.model_hash = file_hash(self.model_path)
+                self.model = load_model(self.model_path, self.model_hash, backend=self.backend)
+                self.message_signal.emit("模型加载成功")
+
+            if not self.control.cancelled:
+                # 续跑清单按模型哈希区分，换模型后所有图片都会重新处理
+                model_hash = (self.model_hash or file_hash(self.model_path)) if self.resume else None
+                # 检测缓存：内容相同的图片（例如改名的副本）直接复用之前的检测结果
+                cache = open_detection_cache() if self.use_cache else None
+                summary = detect_images(self.model, self.image_files, self.control,
+                                        on_progress=self.progress_signal.emit,
+                                        on_message=self.message_signal.emit,
+                                        batch_size=self.batch_size,
+                                        export_txt=self.export_files,
+                                        export_xml=self.export_files,
+                                        split=self.split,
+                                        model_hash=model_hash,
+                                        fast_decode_size=self.fast_decode_size,
+                                        render=self.render,
+                                        tile=self.tile,
+                                        cache=cache,
+                                        cascade_size=self.cascade_size)
+                if summary.get('refined'):
+                    self.message_signal.emit(f"{summary['refined']} 张图片在低分辨率下结果不确定，已按原尺寸重新推理")
+                if summary.get('cached'):
+                    self.message_signal.emit(f"{summary['cached']} 张图片复用了缓存的检测结果")
+                if summary.get('report'):
+                    self.message_signal.emit(format_report(summary['report']))
+        except Exception as e:
+            self.message_signal.emit(f"Error during detection: {str(e)}")
+        finally:
+            if cache is not None:
+                cache.close()
+            summary['cancelled'] = self.control.cancelled
+            self.finished_signal.emit(summary)
+
+    def pause(self):
+        self.control.pause()
+
+    def resume(self):
+        self.control.resume()
+
+    def cancel(self):
+        self.control.cancel()
+
+
+class SplitWorker(QThread):
+    """
+    在后台线程中执行标签排序和多进程裁剪，裁剪信息通过 image_cropped_signal 按顺序传回界面。
+    传入 model_hash 时按续跑清单跳过已经裁剪过的图片，并记录本次裁剪完成的图片。
+    """
+    image_cropped_signal = pyqtSignal(str)
+    progress_signal = pyqtSignal(int, int)
+    finished_signal = pyqtSignal(bool)
+
+    def __init__(self, crop_folder, records=None, input_folder=None, xml_folder=None, workers=None, model_hash=None,
+                 settings='', parent=None):
+        super().__init__(parent)
+        self.crop_folder = crop_folder
+        self.records = records
+        self.input_folder = input_folder
+        self.xml_folder = xml_folder
+        self.workers = workers
+        self.model_hash = model_hash
+        self.settings = settings
+
+    def run(self):
+        try:
+            records = self.records
+            results_folder = os.path.dirname(self.crop_folder)
+            if not records and os.path.exists(os.path.join(results_folder, RESULTS_FILE)):
+                # 内存中没有检测记录时优先读取 results.jsonl，不再逐个解析 gen-xml
+                records = load_records(results_folder, self.input_folder)
+            if records:
+                # 检测记录已排序，直接裁剪；续跑时跳过已经裁剪过的图片
+                manifest = None
+                if self.model_hash is not None:
+                    manifest = RunManifest(os.path.join(results_folder, 'manifest.json'), self.input_folder,
+                                           self.model_hash, self.settings)
+                    todo = [record for record in records if not manifest.is_done(record.image_path, 'cropped')]
+                    if len(todo) < len(records):
+                        self.image_cropped_signal.emit(f"跳过 {len(records) - len(todo)} 张已裁剪的图片")
+                    records = todo
+                with ResultStore(results_folder, self.input_folder) as store:
+                    def on_result(image_file, files, error):
+                        if error:
+                            return
+                        if manifest is not None:
+                            manifest.mark(image_file, 'cropped')
+                        store.add_crops(image_file, files)
+
+                    try:
+                        crop_records(records, self.crop_folder, gui_instance=self, workers=self.workers,
+                                     on_progress=self.progress_signal.emit, on_result=on_result)
+                    finally:
+                        if manifest is not None:
+                            manifest.flush()
+            else:
+                main1(self.xml_folder, self.xml_folder)
+                main2(self.input_folder, self.xml_folder, self.crop_folder, gui_instance=self, workers=self.workers,
+                      on_progress=self.progress_signal.emit)
+            self.finished_signal.emit(True)
+        except Exception as e:
+            self.image_cropped_signal.emit(f"Error during split: {str(e)}")
+            self.finished_signal.emit(False)
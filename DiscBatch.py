@@ -0,0 +1,187 @@
+"""
+圆盘分割的命令行批处理入口，不依赖 PyQt5，可在 Linux 服务器上运行。
+
+用法示例：
+    python DiscBatch.py /data/discs --model pt/WoodDisc.pt --batch-size 8 --workers 16 --summary run.json
+
+对 source 下每个包含图片的文件夹（递归查找，跳过 DetectResults）依次执行 检测 -> 排序 -> 裁剪，
+输出目录结构与界面程序相同：<文件夹>/DetectResults/{gen-txt, gen-xml, crop}。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from DiscPipeline import BACKENDS, RENDER_POLICIES, detect_images, list_images, load_model, open_detection_cache
+from ResultStore import ResultStore, export_voc
+from RunManifest import RunManifest, file_hash
+from StageTimer import StageTimer, format_report
+from TreeMain import crop_records
+
+
+def find_image_folders(sources):
+    """
+    递归查找包含图片的文件夹，跳过已有的 DetectResults 输出目录。
+    """
+    for source in sources:
+        for root, dirs, files in os.walk(source):
+            dirs[:] = sorted(d for d in dirs if d != 'DetectResults')
+            image_files = sorted(list_images(root))
+            if image_files:
+                yield root, image_files
+
+
+def process_folder(model, image_files, model_hash, args, cache=None):
+    """
+    处理单个文件夹，返回该文件夹的汇总信息（不含检测记录）。
+    """
+    summary = detect_images(model, image_files, on_message=print if args.verbose else None,
+                            batch_size=args.batch_size, export_txt=not args.no_txt, export_xml=not args.no_xml,
+                            split=args.fused, model_hash=model_hash,
+                            fast_decode_size=args.img_size if args.fast_decode else None,
+                            writer_threads=args.writer_threads, render=args.render, results=not args.no_results,
+                            tile=args.tile, tile_overlap=args.tile_overlap, tile_batch=args.tile_batch,
+                            cache=cache, cascade_size=args.cascade, refine_size=args.img_size,
+                            cascade_conf=args.cascade_conf, decode_workers=args.decode_workers,
+                            prefetch_mb=args.prefetch_mb)
+    records = summary.pop('records')
+    summary['boxes'] = sum(len(record) for record in records)
+    summary['crop_failed'] = 0
+    if not args.fused and not args.no_crop:
+        t0 = time.perf_counter()
+        crop_folder = os.path.join(summary['inference_folder'], 'crop')
+        manifest = None
+        if model_hash is not None:
+            manifest = RunManifest(os.path.join(summary['inference_folder'], 'manifest.json'),
+                                   os.path.dirname(image_files[0]), model_hash, summary['settings'])
+            # 续跑时跳过已经裁剪过的图片
+            records = [record for record in records if not manifest.is_done(record.image_path, 'cropped')]
+
+        store = None
+        if not args.no_results:
+            store = ResultStore(summary['inference_folder'], os.path.dirname(image_files[0]))
+
+        def on_result(image_file, output_files, error):
+            if error:
+                return
+            if manifest is not None:
+                manifest.mark(image_file, 'cropped')
+            if store is not None:
+                store.add_crops(image_file, output_files)
+
+        try:
+            summary['crop_failed'] = crop_records(records, crop_folder, workers=args.workers, on_result=on_result)
+        finally:
+            if store is not None:
+                store.close()
+        summary['crop_folder'] = crop_folder
+        if manifest is not None:
+            manifest.flush()
+        timer = summary['timer']
+        timer.add('crop', time.perf_counter() - t0, len(records))
+        summary['timings'] = timer.totals()
+        summary['report'] = timer.report(summary['inferred'], resumed=summary['resumed'], cached=summary['cached'])
+    if args.export_voc and not args.no_results:
+        # 由 results.jsonl 一次性生成 VOC XML，代替检测时逐图写出
+        summary['voc_files'] = export_voc(summary['inference_folder'], os.path.dirname(image_files[0]),
+                                          summary['xml_folder'])
+    return summary
+
+
+def run(args):
+    t_start = time.perf_counter()
+    t0 = time.perf_counter()
+    model = load_model(args.model, backend=args.backend)
+    model_load_time = time.perf_counter() - t0
+    model_hash = None if args.no_resume else file_hash(args.model)
+    cache = open_detection_cache(max_mb=args.cache_mb) if args.cache else None
+
+    folders = []
+    timer = StageTimer()
+    try:
+        for folder, image_files in find_image_folders(args.source):
+            print(f"Processing {folder} ({len(image_files)} images)")
+            t0 = time.perf_counter()
+            summary = process_folder(model, image_files, model_hash, args, cache)
+            summary['folder'] = folder
+            summary['wall_time'] = time.perf_counter() - t0
+            timer.merge(summary.pop('timer'))
+            folders.append(summary)
+            print(f"  processed {summary['processed']}, resumed {summary['resumed']}, cached {summary['cached']}, "
+                  f"refined {summary['refined']}, "
+                  f"failed {summary['failed']}, crop failed {summary['crop_failed']} in {summary['wall_time']:.1f}s")
+            if args.verbose:
+                print(format_report(summary['report']))
+    finally:
+        if cache is not None:
+            cache.close()
+
+    wall_time = time.perf_counter() - t_start
+    processed = sum(f['processed'] for f in folders)
+    report = {
+        'model': args.model,
+        'backend': args.backend,
+        'batch_size': args.batch_size,
+        'workers': args.workers,
+        'model_load_time': model_load_time,
+        'wall_time': wall_time,
+        'images': sum(f['total'] for f in folders),
+        'processed': processed,
+        'failed': sum(f['failed'] + f['crop_failed'] + f['write_failed'] for f in folders),
+        'timings': timer.totals(),
+        'stages': timer.report(sum(f['inferred'] for f in folders), wall_time,
+                               resumed=sum(f['resumed'] for f in folders), cached=sum(f['cached'] for f in folders)),
+        'folders': folders,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="圆盘检测、排序和裁剪的命令行批处理")
+    parser.add_argument('source', nargs='+', help="图片文件夹，会递归处理其中所有包含图片的子文件夹")
+    parser.add_argument('--model', default=os.path.join('pt', 'WoodDisc.pt'), help="模型权重 .pt 路径")
+    parser.add_argument('--backend', choices=list(BACKENDS), default='pytorch',
+                        help="推理后端；非 pytorch 后端首次使用时自动导出并缓存到权重所在目录的 cache 子目录")
+    parser.add_argument('--batch-size', type=int, default=4, help="每次推理的图片数量")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="裁剪进程数")
+    parser.add_argument('--decode-workers', type=int, help="解码线程数，默认 min(4, CPU核心数)")
+    parser.add_argument('--prefetch-mb', type=int, default=512, help="已解码、等待推理的图片的内存上限（MB）")
+    parser.add_argument('--writer-threads', type=int, default=2, help="写出线程数（图片编码和写盘）")
+    parser.add_argument('--img-size', type=int, default=640, help="模型输入尺寸")
+    parser.add_argument('--cascade', type=int, help="两阶段推理的第一阶段尺寸（例如 320），结果不确定的图片按 --img-size 重新推理")
+    parser.add_argument('--cascade-conf', type=float, default=0.5, help="第一阶段结果可信所需的最高置信度")
+    parser.add_argument('--tile', type=int, help="分块推理的块大小（像素，不小于 320），用于高分辨率图片，默认整图推理")
+    parser.add_argument('--tile-overlap', type=float, default=0.2, help="相邻块的重叠比例")
+    parser.add_argument('--tile-batch', type=int, default=8, help="每次推理的块数量")
+    parser.add_argument('--fused', action='store_true', help="检测后直接从解码的图片裁剪（检测并分割）")
+    parser.add_argument('--fast-decode', action='store_true', help="按模型输入尺寸降采样解码大图")
+    parser.add_argument('--cache', action='store_true', help="按图片内容复用检测缓存，跳过重复图片的推理")
+    parser.add_argument('--cache-mb', type=int, default=512, help="检测缓存的大小上限（MB），超出时淘汰最久未用的记录")
+    parser.add_argument('--no-resume', action='store_true', help="忽略续跑清单，重新处理所有图片")
+    parser.add_argument('--render', choices=RENDER_POLICIES, default='full',
+                        help="推理结果图片：none 不保存，thumbnail 只保存缩略图，full 保存原尺寸标注图")
+    parser.add_argument('--no-txt', action='store_true', help="不导出 gen-txt")
+    parser.add_argument('--no-xml', action='store_true', help="不导出 gen-xml")
+    parser.add_argument('--export-voc', action='store_true',
+                        help="处理完每个文件夹后由 results.jsonl 生成 gen-xml（VOC XML），可配合 --no-xml 使用")
+    parser.add_argument('--no-results', action='store_true', help="不写入运行级结果文件 results.jsonl/results.npz")
+    parser.add_argument('--no-crop', action='store_true', help="只检测和排序，不裁剪")
+    parser.add_argument('--summary', help="JSON 汇总文件路径，默认输出到标准输出")
+    parser.add_argument('--verbose', action='store_true', help="输出每张图片的处理信息")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    report = run(parse_args(argv))
+    return 1 if report['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,785 @@
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from AsyncWriter import AsyncWriter
+from DiscRecord import DiscRecord
+from ResultStore import ResultStore
+from RunManifest import RunManifest, file_hash
+from StageTimer import StageTimer
+from TreeMain import crop_array, crop_boxes, crop_path_for, expected_disc_count, order_records
+
+_STOP = object()  # 队列结束标记
+
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp')
+YOLOV5_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yolov5-master')
+RENDER_POLICIES = ('none', 'thumbnail', 'full')  # 推理结果图片：不保存 / 缩略图 / 原尺寸
+THUMBNAIL_SIZE = 640  # 缩略图最长边
+# 推理后端及 export.run 导出产物的后缀；pytorch 为直接加载 .pt
+BACKENDS = {'pytorch': '.pt', 'onnx': '.onnx', 'openvino': '_openvino_model', 'torchscript': '.torchscript'}
+MIN_TILE = 320  # 分块推理的最小块尺寸，块过小时窗口数量急剧增加
+DETECTION_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pt', 'cache', 'detections.db')
+PREPROCESS_WORKERS = min(8, os.cpu_count() or 1)  # AutoShape 预处理线程数
+
+
+class PipelineControl:
+    """
+    检测流水线的控制句柄，界面线程通过它暂停、继续或取消后台任务。
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # 唤醒处于暂停状态的线程，让它们尽快退出
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def checkpoint(self):
+        """
+        暂停时阻塞，直到继续或取消；返回是否已取消。
+        """
+        self._running.wait()
+        return self._cancelled.is_set()
+
+
+class FrameBuffer:
+    """
+    有界的已解码图片缓存，在检测和裁剪之间暂存原图数组。
+    超过内存上限时不再缓存，裁剪时退回到重新读取原图。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def put(self, key, frame):
+        """
+        缓存一张图片，返回是否缓存成功。
+        """
+        with self._lock:
+            if self.nbytes + frame.nbytes > self.max_bytes:
+                return False
+            self._frames[key] = frame
+            self.nbytes += frame.nbytes
+            return True
+
+    def pop(self, key):
+        with self._lock:
+            frame = self._frames.pop(key, None)
+            if frame is not None:
+                self.nbytes -= frame.nbytes
+            return frame
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._frames
+
+
+class MemoryBudget:
+    """
+    按字节计数的额度，限制已解码但尚未送入推理的图片总内存。
+    解码线程放入图片前 acquire()，额度不足时阻塞形成背压；推理线程取出图片后 release()。
+    已占用为0时总是允许放入，单张超过额度的大图也不会死锁。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes):
+        with self._cond:
+            while self.used and self.used + nbytes > self.max_bytes:
+                self._cond.wait()
+            self.used += nbytes
+
+    def release(self, nbytes):
+        with self._cond:
+            self.used -= nbytes
+            self._cond.notify_all()
+
+
+def list_images(folder):
+    """
+    列出文件夹（不含子文件夹）中的图片文件路径。
+    """
+    return [os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(IMAGE_SUFFIXES)]
+
+
+def model_cache_path(model_path, model_hash):
+    """
+    融合后模型的缓存路径：权重所在目录下的 cache 子目录，以权重哈希和 torch 版本命名。
+    """
+    import torch
+
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    torch_version = torch.__version__.split('+')[0]
+    return os.path.join(os.path.dirname(os.path.abspath(model_path)), 'cache',
+                        f"{stem}-{model_hash[:16]}-torch{torch_version}.fused.pt")
+
+
+def backend_artifact_path(model_path, model_hash, backend):
+    """
+    返回权重导出为 backend 格式后的缓存路径：<.pt所在目录>/cache/<名称>-<哈希前16位><后缀>。
+    """
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(model_path)), 'cache',
+                        f"{stem}-{model_hash[:16]}{BACKENDS[backend]}")
+
+
+def export_backend(model_path, model_hash, backend, img_size=640):
+    """
+    首次使用某个后端时通过 yolov5-master/export.py 的 export.run 导出模型，之后直接返回缓存的导出产物。
+    导出使用动态输入尺寸，可以接受任意批大小和 AutoShape 填充后的图片尺寸。
+    """
+    artifact = backend_artifact_path(model_path, model_hash, backend)
+    if os.path.exists(artifact):
+        return artifact
+    if YOLOV5_DIR not in sys.path:
+        sys.path.insert(0, YOLOV5_DIR)
+    import export
+
+    # 导出产物与权重同名，先把权重复制为带哈希的文件名，再在缓存目录中导出
+    weights = backend_artifact_path(model_path, model_hash, 'pytorch')
+    os.makedirs(os.path.dirname(weights), exist_ok=True)
+    if not os.path.exists(weights):
+        shutil.copyfile(model_path, weights)
+    export.run(weights=weights, include=(backend,), imgsz=(img_size, img_size), device='cpu', dynamic=True)
+    if not os.path.exists(artifact):
+        raise RuntimeError(f"Export to {backend} failed: {artifact} not found")
+    return artifact
+
+
+def prepare_model(model, model_hash, backend='pytorch'):
+    """
+    设置加载好的 AutoShape 模型的推理选项，返回模型本身。
+    :param model_hash: 权重哈希，与后端一起作为检测缓存键中的模型标识，换模型后旧结果不会被复用
+    """
+    model.eval()  # Set the model to evaluation mode
+    model.cache_tag = model_hash if backend == 'pytorch' else f"{model_hash}-{backend}"
+    model.backend = backend
+    model.bucket = True  # 横竖混排的一批图片按形状分组推理，不再统一填充到最大尺寸
+    model.workers = PREPROCESS_WORKERS  # 一批图片的缩放、填充在线程池中并行完成
+    return model
+
+
+def run_settings(model, fast_decode_size=None, tiling=None, cascade=None):
+    """
+    由影响检测结果的设置（权重、后端、阈值、降采样解码、分块、两阶段推理）组成的标识，
+    用于续跑清单和检测缓存：任意一项变化时，之前的结果不再复用。
+    """
+    return '|'.join(str(x) for x in (getattr(model, 'cache_tag', ''), getattr(model, 'backend', 'pytorch'),
+                                      model.conf, model.iou, fast_decode_size, tiling, cascade))
+
+
+def load_model(model_path, model_hash=None, use_cache=True, backend='pytorch'):
+    """
+    从本地 yolov5-master 加载自定义权重，返回 AutoShape 模型。
+
+    use_cache 时把加载并融合好的 AutoShape 模型整体序列化到 model_cache_path，之后直接反序列化，
+    跳过 hubconf 的依赖检查、attempt_load 和层融合；权重内容变化时哈希不同，会自动重新生成。
+    backend 不是 pytorch 时先导出（或读取缓存的）ONNX/OpenVINO/TorchScript 模型，再用 DetectMultiBackend 加载，
+    外面同样包一层 AutoShape，调用方式不变。
+    """
+    import torch
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    model_hash = model_hash or file_hash(model_path)
+    if backend != 'pytorch':
+        artifact = export_backend(model_path, model_hash, backend)
+        from models.common import AutoShape, DetectMultiBackend
+
+        model = AutoShape(DetectMultiBackend(artifact, device=torch.device('cpu')))
+        return prepare_model(model, model_hash, backend)
+
+    cache_path = None
+    if use_cache:
+        cache_path = model_cache_path(model_path, model_hash)
+        if os.path.exists(cache_path):
+            # 反序列化需要导入 yolov5-master 中的 models.common 等模块
+            if YOLOV5_DIR not in sys.path:
+                sys.path.insert(0, YOLOV5_DIR)
+            try:
+                return prepare_model(torch.load(cache_path, map_location='cpu'), model_hash)
+            except Exception:
+                pass  # 缓存损坏或与当前版本不兼容，重新加载
+
+    model = torch.hub.load(YOLOV5_DIR, 'custom', path=model_path, force_reload=True, source='local')
+    prepare_model(model, model_hash)
+
+    if cache_path is not None:
+        tmp_path = cache_path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            torch.save(model, tmp_path)
+            os.replace(tmp_path, cache_path)
+        except Exception:
+            # 缓存只是加速手段，写入失败不影响本次使用
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return model
+
+
+def open_detection_cache(path=DETECTION_CACHE_PATH, max_mb=512):
+    """
+    打开按图片内容哈希索引的检测缓存（yolov5-master/utils/detection_cache.py），超过 max_mb 时淘汰最久未用的记录。
+    同一个缓存既可以传给 detect_images，也可以设置为 model.cache 供 AutoShape 直接使用。
+    """
+    if YOLOV5_DIR not in sys.path:
+        sys.path.insert(0, YOLOV5_DIR)
+    from utils.detection_cache import DetectionCache
+
+    return DetectionCache(path, max_bytes=max_mb * 1024 * 1024)
+
+
+def make_output_folders(image_files):
+    """
+    在图片所在文件夹下创建 DetectResults 及 gen-txt、gen-xml 子目录。
+    """
+    inference_folder = os.path.join(os.path.dirname(image_files[0]), 'DetectResults')
+    txt_folder = os.path.join(inference_folder, 'gen-txt')
+    xml_folder = os.path.join(inference_folder, 'gen-xml')
+    for folder in (inference_folder, txt_folder, xml_folder):
+        os.makedirs(folder, exist_ok=True)
+    return inference_folder, txt_folder, xml_folder
+
+
+def txt_path_for(img_path, txt_folder):
+    return os.path.join(txt_folder, os.path.basename(img_path).replace('.jpg', '.txt').replace('.png', '.txt'))
+
+
+def xml_path_for(txt_file_path, xml_folder):
+    return os.path.join(xml_folder, os.path.basename(txt_file_path).replace('.txt', '.xml'))
+
+
+# 按缩小倍数从大到小排列的降采样解码标志，JPEG 在 DCT 域直接缩小，解码更快、内存更少
+REDUCED_DECODE_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                        (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def read_image(img_path):
+    """
+    读取图片并转换为RGB数组。
+    """
+    img = cv2.imread(img_path)
+    if img is None:
+        raise ValueError(f"无法读取图片 {img_path}")
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def image_size(img_path):
+    """
+    只读取文件头获得图片尺寸 (width, height)，并按EXIF方向换算为 cv2.imread 解码后的尺寸。
+    """
+    with Image.open(img_path) as im:
+        width, height = im.size
+        if im.getexif().get(0x0112, 1) in (5, 6, 7, 8):  # 旋转90度的方向
+            width, height = height, width
+    return width, height
+
+
+def read_image_for_inference(img_path, target_size=None):
+    """
+    读取用于推理的RGB图片，返回 (img, (width, height), (sx, sy))。
+
+    target_size 为模型输入尺寸时，选择使最长边仍不小于 target_size 的最大缩小倍数
+    （2/4/8）进行降采样解码，再缩放到最长边等于 target_size，推理时不必再缩放；
+    sx/sy 分别为原图与返回图片的宽、高之比（缩放取整后两者可能不同）。target_size 为 None 时完整解码，
+    sx/sy 均为 1。
+    """
+    if not target_size:
+        img = read_image(img_path)
+        return img, (img.shape[1], img.shape[0]), (1.0, 1.0)
+
+    width, height = image_size(img_path)
+    img = None
+    for factor, flag in REDUCED_DECODE_FLAGS:
+        if max(width, height) / factor >= target_size:
+            img = cv2.imread(img_path, flag)
+            if img is None:
+                raise ValueError(f"无法读取图片 {img_path}")
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            break
+    if img is None:
+        img = read_image(img_path)
+    scale = max(width, height) / target_size
+    if scale > 1.0:
+        img = cv2.resize(img, (round(width / scale), round(height / scale)), interpolation=cv2.INTER_AREA)
+    return img, (width, height), (width / img.shape[1], height / img.shape[0])
+
+
+def needs_refinement(img_path, im, pred, cascade):
+    """
+    判断低分辨率推理的结果是否可信：没有检测到圆盘、最高置信度低于 cascade['conf']、
+    有标注框贴近图片边缘（可能是被截断的圆盘），或圆盘数量与文件名中的编号范围不符时需要重新推理。
+
+    :param im: 推理输入的图片数组
+    :param pred: 该图片的检测结果 (N,6) [x1, y1, x2, y2, conf, cls]，坐标对应 im
+    """
+    if len(pred) == 0 or float(pred[:, 4].max()) < cascade['conf']:
+        return True
+    height, width = im.shape[:2]
+    margin = cascade['border'] * max(height, width)
+    xyxy = pred[:, :4]
+    if bool(((xyxy[:, 0] < margin) | (xyxy[:, 1] < margin) |
+             (xyxy[:, 2] > width - margin) | (xyxy[:, 3] > height - margin)).any()):
+        return True
+    expected = expected_disc_count(os.path.splitext(os.path.basename(img_path))[0])
+    return expected is not None and expected != len(pred)
+
+
+def infer_batch(model, batch, frames=None, render='full', tiling=None, cascade=None, stats=None, timer=None):
+    """
+    对一批图片执行一次推理，并把结果按原顺序拆分回每张图片。
+
+    :param model: YOLOv5 AutoShape 模型，接受图片列表并堆叠为一个 BCHW 张量
+    :param batch: [(img_path, img, (width, height, (sx, sy))), ...]，img 为RGB数组，
+                  width/height 为原图尺寸，sx/sy 为原图与 img 的宽、高之比
+    :param frames: FrameBuffer，其中缓存的原图留作裁剪，绘制检测框时使用副本
+    :param render: 结果图片的绘制方式，见 RENDER_POLICIES；thumbnail 在缩小后的图片上绘制
+    :param tiling: 分块推理参数 {'tile', 'overlap', 'batch_size'}，传给 AutoShape.tiled；None 表示整图推理
+    :param cascade: 两阶段推理参数 {'size', 'refine_size', 'conf', 'border'}：先按 size 推理整批图片，
+                    needs_refinement 判断为不可信的图片再按 refine_size 推理；None 表示只推理一次
+    :param stats: 统计字典，两阶段推理时 stats['refined'] 累加重新推理的图片数
+    :param timer: StageTimer，记录预处理、推理、NMS（取自 Detections.times）、绘制和排序的耗时
+    :return: [(img_path, result_img, record, error), ...]，record 为已排序的 DiscRecord，
+             render='none' 时 result_img 为 None
+    """
+    timer = timer if timer is not None else StageTimer()
+    try:
+        ims = [img for _, img, _ in batch]
+        if tiling:
+            results = model.tiled(ims, **tiling)
+        elif cascade:
+            results = model(ims, size=cascade['size'])
+            redo = [j for j, (img_path, _, _) in enumerate(batch)
+                    if needs_refinement(img_path, ims[j], results.pred[j], cascade)]
+            if redo:
+                refined = model([ims[j] for j in redo], size=cascade['refine_size'])
+                pred = list(results.pred)
+                for j, p in zip(redo, refined.pred):
+                    pred[j] = p
+                for p, rt in zip(results.times, refined.times):
+                    p.t += rt.t
+                results = type(results)(results.ims, pred, results.files, results.times, results.names, refined.s,
+                                        shapes=results.shapes)
+                if stats is not None:
+                    stats['refined'] = stats.get('refined', 0) + len(redo)
+        else:
+            results = model(ims)
+        timer.add_profiles(results.times, len(batch))
+        with timer.time('render', len(batch)):
+            if render == 'full':
+                if frames is not None:
+                    # render() 会直接在图片数组上绘制，缓存的原图需要保持干净
+                    results.ims = [im.copy() if img_path in frames else im
+                                   for im, (img_path, _, _) in zip(results.ims, batch)]
+                rendered = results.render()
+            elif render == 'thumbnail':
+                rendered = results.thumbnails(THUMBNAIL_SIZE)
+            else:
+                rendered = [None] * len(batch)
+        with timer.time('sort', len(batch)):
+            records = [DiscRecord.from_xyxy(img_path, W, H, results.xyxy[j].cpu().numpy(), scale)
+                       for j, (img_path, img, (W, H, scale)) in enumerate(batch)]
+            # 标签排序，先左右，后上下；整批一次完成
+            records = order_records(records)
+        return [(img_path, rendered[j], records[j], None) for j, (img_path, _, _) in enumerate(batch)]
+    except Exception as e:
+        if len(batch) == 1:
+            img_path = batch[0][0]
+            return [(img_path, None, None, e)]
+        # 整批失败时逐张重试，只让出错的图片失败
+        return [output for item in batch
+                for output in infer_batch(model, [item], frames, render, tiling, cascade, stats, timer)]
+
+
+def detect_images(model, image_files, control=None, on_progress=None, on_message=None, prefetch=4, batch_size=1,
+                  export_txt=True, export_xml=True, split=False, frame_buffer_mb=1024, model_hash=None,
+                  fast_decode_size=None, writer_threads=2, render='full', results=True, tile=None, tile_overlap=0.2,
+                  tile_batch=8, cache=None, cascade_size=None, refine_size=640, cascade_conf=0.5, decode_workers=None,
+                  prefetch_mb=512):
+    """
+    分阶段执行检测：解码线程池 -> 推理（当前线程）-> 写出线程，阶段之间用有界队列连接，
+    使读图、写图与推理互相重叠。cv2 解码时释放 GIL，多个解码线程可以与推理并行；
+    已解码等待推理的图片总内存受 prefetch_mb 限制，图片越大预读的张数越少。每张图片的结果保存为已排序的 DiscRecord，可直接用于裁剪；
+    推理图片、txt/xml 导出和裁剪图片都提交给 AsyncWriter，由写出线程池编码和写盘。
+    所有图片的检测结果追加写入 DetectResults/results.jsonl（见 ResultStore），逐图的 txt/xml 只是可选导出。
+
+    split=True 时为“检测并分割”模式：解码得到的原图暂存在 FrameBuffer 中，排序后直接从数组裁剪，
+    不再重新读取原图；缓存超过 frame_buffer_mb 时该图片退回到重新读取后裁剪。
+
+    传入 model_hash 时启用 DetectResults/manifest.json 续跑清单：文件大小、修改时间和模型都未变化的图片
+    直接使用清单中保存的结果，只补做缺少的阶段；新增或修改过的图片才会重新推理。
+
+    :param model: torch.hub 加载的 YOLOv5 AutoShape 模型
+    :param image_files: 图片路径列表
+    :param control: PipelineControl，用于暂停和取消
+    :param on_progress: 回调 on_progress(done, total)，每张图片写出后调用
+    :param on_message: 回调 on_message(text)，用于输出处理信息
+    :param prefetch: 每个队列最多缓存的图片数量（解码队列另受 prefetch_mb 限制）
+    :param batch_size: 每次推理的图片数量
+    :param export_txt: 是否导出 gen-txt
+    :param export_xml: 是否导出已排序的 gen-xml
+    :param split: 是否在检测后直接裁剪到 DetectResults/crop
+    :param frame_buffer_mb: 原图缓存的内存上限（MB）
+    :param model_hash: 模型权重的哈希，None 表示不使用续跑清单
+    :param fast_decode_size: 模型输入尺寸；设置后解码线程按该尺寸降采样解码并缩放图片，检测框换算回原图坐标。
+                             降采样得到的图片不能直接用于裁剪，此时“检测并分割”会重新读取原图
+    :param writer_threads: 写出线程数，图片编码（PNG/JPEG）在这些线程中进行
+    :param render: 推理结果图片的保存方式：none 不保存，thumbnail 只保存最长边 THUMBNAIL_SIZE 的缩略图，
+                   full 保存原尺寸的标注图片
+    :param results: 是否把检测结果和裁剪路径写入运行级结果文件 results.jsonl / results.npz
+    :param tile: 分块推理的块大小（像素），None 表示整图推理。高分辨率图片按重叠的 tile x tile 分块，
+                 所有块按 tile_batch 成批推理，再把各块的检测框与一次整图推理的结果合并到原图坐标，
+                 被块边界切开的圆盘合并为一个框；块尺寸不能小于 MIN_TILE，分块推理时不使用降采样解码
+    :param tile_overlap: 相邻块的重叠比例
+    :param tile_batch: 每次推理的块数量
+    :param cascade_size: 两阶段推理的第一阶段尺寸（例如 320），None 表示按模型默认尺寸推理一次。
+                         置信度低于 cascade_conf、标注框贴近边缘或圆盘数量与文件名不符的图片按 refine_size 重新推理；
+                         分块推理时不使用两阶段推理
+    :param refine_size: 第二阶段推理尺寸
+    :param cascade_conf: 第一阶段结果可信所需的最高置信度
+    :param cache: DetectionCache（见 open_detection_cache）。按图片文件内容哈希查找，内容相同的图片（例如改名的副本）
+                  直接复用保存的检测框，不再解码和推理，也不生成推理结果图片；同一次运行中的重复图片
+                  只推理第一张，其余等第一张的结果出来后复用
+    :param decode_workers: 解码线程数，默认 min(4, CPU核心数)
+    :param prefetch_mb: 已解码、等待推理的图片的内存上限（MB）
+    :return: 汇总信息字典，其中 records 为按处理顺序排列的 DiscRecord 列表；
+             report 为各阶段耗时的 p50/p95/max 和吞吐量（同时写入 DetectResults/run_report.json），
+             timings 为各阶段总耗时，timer 为本次运行的 StageTimer
+    """
+    if render not in RENDER_POLICIES:
+        raise ValueError(f"Unknown render policy: {render}")
+    tiling = None
+    if tile:
+        if int(tile) < MIN_TILE:
+            raise ValueError(f"Tile size must be at least {MIN_TILE} pixels: {tile}")
+        if not 0 <= tile_overlap <= 0.5:
+            raise ValueError(f"Tile overlap must be between 0 and 0.5: {tile_overlap}")
+        tiling = {'tile': int(tile), 'overlap': tile_overlap, 'batch_size': max(1, int(tile_batch))}
+        fast_decode_size = None
+    cascade = None
+    if cascade_size and not tiling:
+        cascade = {'size': int(cascade_size), 'refine_size': int(refine_size), 'conf': cascade_conf, 'border': 0.01}
+    control = control or PipelineControl()
+    emit = on_message or (lambda message: None)
+    inference_folder, txt_folder, xml_folder = make_output_folders(image_files)
+    num_files = len(image_files)
+    summary = {'inference_folder': inference_folder, 'txt_folder': txt_folder, 'xml_folder': xml_folder,
+               'total': num_files, 'processed': 0, 'failed': 0, 'cancelled': False, 'W': None, 'H': None,
+               'records': [], 'resumed': 0, 'cached': 0, 'inferred': 0, 'refined': 0, 'write_failed': 0}
+    timer = StageTimer()
+    summary_lock = threading.Lock()
+    frames = None
+    if split:
+        summary['crop_folder'] = os.path.join(inference_folder, 'crop')
+        os.makedirs(summary['crop_folder'], exist_ok=True)
+        frames = FrameBuffer(frame_buffer_mb * 1024 * 1024)
+
+    # 续跑：清单中已完成排序的图片直接复用保存的检测记录，不再解码和推理；
+    # 清单记录本次的检测设置，换用分块、两阶段推理、降采样解码或后端后会重新检测
+    settings = run_settings(model, fast_decode_size, tiling, cascade)
+    summary['model_hash'], summary['settings'] = model_hash, settings
+    manifest, resumed = None, {}
+    if model_hash is not None:
+        manifest = RunManifest(os.path.join(inference_folder, 'manifest.json'), os.path.dirname(image_files[0]),
+                               model_hash, settings)
+        for img_path in image_files:
+            record = manifest.record(img_path)
+            if record is not None:
+                resumed[img_path] = record
+        summary['resumed'] = len(resumed)
+        if resumed:
+            emit(f"跳过 {len(resumed)} 张已处理的图片")
+
+    store = None
+    if results:
+        store = ResultStore(inference_folder, os.path.dirname(image_files[0]))
+        summary['results_file'] = store.path
+
+    # 检测缓存：键由图片文件内容、模型哈希和影响检测结果的参数组成
+    cached, cache_keys = {}, {}
+    # 同一次运行中内容相同的图片（例如副本）只推理第一张：duplicates 为 图片 -> 键，
+    # inflight 为 键 -> 第一张图片，key_records 为 键 -> 第一张图片的检测记录（或异常）
+    duplicates, inflight, key_records = {}, {}, {}
+    inflight_lock = threading.Lock()
+    if cache is not None:
+        cache_tag = cache.tag('DiscRecord', settings)
+
+    def stage_done(img_path, stage):
+        return manifest is not None and manifest.is_done(img_path, stage)
+
+    def mark_done(img_path, *stages, record=None):
+        if manifest is not None:
+            manifest.mark(img_path, *stages, record=record)
+
+    batch_size = max(1, int(batch_size))
+    decode_workers = max(1, decode_workers or min(4, os.cpu_count() or 1))
+    # 解码队列按内存额度限制；同时解码的图片至少能凑满一批，保证推理不会等待凑批
+    decoded = queue.Queue()
+    budget = MemoryBudget(prefetch_mb * 1024 * 1024)
+    decode_window = max(prefetch, batch_size, decode_workers)
+    pending = queue.Queue(maxsize=max(prefetch, batch_size))
+    # 写出队列满时写出阶段阻塞，推理随之放慢，待写的图片不会无限堆积
+    writer = AsyncWriter(threads=writer_threads, max_pending=max(prefetch, batch_size) * 2)
+
+    def timed(stage, fn, *args):
+        with timer.time(stage):
+            return fn(*args)
+
+    def decode_one(img_path):
+        if img_path in resumed:
+            return img_path, None, None, None
+        try:
+            t0 = time.perf_counter()
+            if cache is not None:
+                with open(img_path, 'rb') as f:
+                    key = cache.key(f.read(), cache_tag)
+                pred = cache.get(key)
+                if pred is not None:
+                    width, height = image_size(img_path)
+                    cached[img_path] = DiscRecord(img_path, width, height, pred[:, :4], pred[:, 4], pred[:, 5])
+                    return img_path, None, None, None
+                with inflight_lock:
+                    first = inflight.setdefault(key, img_path)
+                if first != img_path:
+                    duplicates[img_path] = key  # 等待第一张图片的检测结果，不再解码和推理
+                    return img_path, None, None, None
+                cache_keys[img_path] = key
+            img, (width, height), scale = read_image_for_inference(img_path, fast_decode_size)
+            timer.add('decode', time.perf_counter() - t0)
+            if frames is not None and scale == (1.0, 1.0):
+                frames.put(img_path, img)
+            return img_path, img, (width, height, scale), None
+        except Exception as e:
+            return img_path, None, None, e
+
+    def put_decoded(item):
+        if item[1] is not None:
+            budget.acquire(item[1].nbytes)
+        decoded.put(item)
+
+    def take_decoded():
+        item = decoded.get()
+        if item is not _STOP and item[1] is not None:
+            budget.release(item[1].nbytes)
+        return item
+
+    def decode_stage():
+        # 解码线程池并行读图，结果按原顺序放入队列
+        # letterbox 仍留在 AutoShape 中完成：填充尺寸取决于整批图像（bucket 形状）、
+        # 级联复检和切片推理的输入尺寸，且 AutoShape.workers 已在线程池中并行 letterbox，
+        # 在此处提前处理会绕过 AutoShape 的预处理与 NMS
+        window = deque()
+        with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+            for img_path in image_files:
+                if control.checkpoint():
+                    break
+                window.append(pool.submit(decode_one, img_path))
+                if len(window) >= decode_window:
+                    put_decoded(window.popleft().result())
+            while window:
+                put_decoded(window.popleft().result())
+        decoded.put(_STOP)
+
+    def write_image(path, result_img):
+        if not cv2.imwrite(path, cv2.cvtColor(result_img, cv2.COLOR_RGB2BGR)):
+            raise OSError(f"cannot write {path}")
+
+    def write_exports(record, txt_file_path, xml_file_path):
+        if export_txt:
+            record.write_txt(txt_file_path)
+        if export_xml:
+            record.write_xml(xml_file_path)
+
+    def on_written(img_path, what, stage=None, files=()):
+        def on_done(error):
+            if error is not None:
+                with summary_lock:
+                    summary['write_failed'] += 1
+                emit(f"Error writing {what} for {os.path.basename(img_path)}: {str(error)}")
+                return
+            if stage is not None:
+                mark_done(img_path, stage)
+            if store is not None and files:
+                store.add_crops(img_path, files)
+            for file in files:
+                emit(f"已裁剪图片: {file}")
+        return on_done
+
+    def reuse(img_path, key):
+        # 重复图片复用第一张图片的检测记录，只替换图片路径
+        source = key_records[key]
+        if isinstance(source, Exception):
+            return img_path, None, None, RuntimeError(f"duplicate image could not be detected: {str(source)}")
+        return img_path, None, DiscRecord(img_path, source.width, source.height, source.boxes, source.conf,
+                                          source.cls, source.xyxy), None
+
+    def write_stage():
+        done = 0
+        waiting = {}  # 键 -> 等待第一张图片检测结果的重复图片
+        while True:
+            item = pending.get()
+            if item is _STOP:
+                break
+            items = deque([item])
+            if item[0] in duplicates:
+                key = duplicates[item[0]]
+                if key not in key_records:
+                    waiting.setdefault(key, []).append(item[0])
+                    continue
+                items = deque([reuse(item[0], key)])
+            while items:
+                img_path, result_img, record, error = items.popleft()
+                key = cache_keys.pop(img_path, None)
+                if frames is not None and error is not None:
+                    frames.pop(img_path)
+                if error is None:
+                    try:
+                        inferred_image_path = None
+                        if img_path not in resumed:
+                            mark_done(img_path, 'inferred', 'sorted', record=record)
+                        if key is not None:
+                            # 缓存保存已排序的标注框 [xmin, ymin, xmax, ymax, conf, cls]；直接写入而不经过写出线程，
+                            # 之后读到的重复图片立即可以命中。写入失败不影响本张图片
+                            try:
+                                cache.put(key, np.column_stack((record.boxes, record.conf, record.cls)))
+                            except Exception as e:
+                                emit(f"Error writing detection cache: {str(e)}")
+                        if store is not None and (img_path not in resumed or img_path not in store):
+                            store.add(record)
+                        if result_img is not None:
+                            inferred_image_path = os.path.join(inference_folder, os.path.basename(img_path))
+                            writer.submit(timed, 'write', write_image, inferred_image_path, result_img,
+                                          on_done=on_written(img_path, 'inference image'))
+                        txt_file_path = txt_path_for(img_path, txt_folder)
+                        if (export_txt or export_xml) and not stage_done(img_path, 'xml'):
+                            writer.submit(timed, 'xml', write_exports, record, txt_file_path,
+                                          xml_path_for(txt_file_path, xml_folder),
+                                          on_done=on_written(img_path, 'detection export',
+                                                             'xml' if export_xml else None))
+                        if frames is not None and not stage_done(img_path, 'cropped'):
+                            frame = frames.pop(img_path)
+                            boxes = record.boxes.tolist()
+                            crop_folder = summary['crop_folder']
+                            crop_files = [crop_path_for(img_path, crop_folder, idx) for idx in range(len(boxes))]
+                            on_done = on_written(img_path, 'crops', 'cropped', crop_files)
+                            if frame is not None:
+                                writer.submit(timed, 'crop', crop_array, frame, boxes, img_path, crop_folder,
+                                              on_done=on_done)
+                            else:
+                                writer.submit(timed, 'crop', crop_boxes, img_path, boxes, crop_folder, on_done=on_done)
+                    except Exception as e:
+                        error = e
+                if key is not None:
+                    key_records[key] = record if error is None else error
+                    items.extend(reuse(path, key) for path in waiting.pop(key, []))
+                done += 1
+                if error is None:
+                    summary['processed'] += 1
+                    summary['W'], summary['H'] = record.width, record.height
+                    summary['records'].append(record)
+                    if inferred_image_path is not None:
+                        emit(f"推理后的图片保存到: {inferred_image_path}")
+                else:
+                    summary['failed'] += 1
+                    emit(f"Error processing image {os.path.basename(img_path)}: {str(error)}")
+                if on_progress:
+                    on_progress(done, num_files)
+
+    threads = [threading.Thread(target=decode_stage, daemon=True),
+               threading.Thread(target=write_stage, daemon=True)]
+    for t in threads:
+        t.start()
+
+    try:
+        batch = []
+        while True:
+            item = take_decoded()
+            if item is _STOP:
+                break
+            if control.checkpoint():
+                continue  # 已取消：继续取出队列中的数据，让解码线程能够退出
+            img_path, img, meta, error = item
+            if img_path in resumed:
+                pending.put((img_path, None, resumed[img_path], None))
+                continue
+            if img_path in cached:
+                summary['cached'] += 1
+                pending.put((img_path, None, cached.pop(img_path), None))
+                continue
+            if img_path in duplicates:
+                summary['cached'] += 1  # 写出阶段等第一张图片的结果到达后复用
+                pending.put((img_path, None, None, None))
+                continue
+            if error is not None:
+                pending.put((img_path, None, None, error))
+                continue
+            batch.append((img_path, img, meta))
+            if len(batch) >= batch_size:
+                outputs = infer_batch(model, batch, frames, render, tiling, cascade, summary, timer)
+                summary['inferred'] += sum(error is None for _, _, _, error in outputs)
+                for output in outputs:
+                    pending.put(output)
+                batch = []
+        if batch and not control.cancelled:
+            outputs = infer_batch(model, batch, frames, render, tiling, cascade, summary, timer)
+            summary['inferred'] += sum(error is None for _, _, _, error in outputs)
+            for output in outputs:
+                pending.put(output)
+    except BaseException:
+        control.cancel()
+        while take_decoded() is not _STOP:
+            pass
+        raise
+    finally:
+        pending.put(_STOP)
+        for t in threads:
+            t.join()
+        writer.close()
+        if store is not None:
+            store.close()
+        if manifest is not None:
+            manifest.flush()
+
+    summary['cancelled'] = control.cancelled
+    summary['timings'] = timer.totals()
+    summary['report'] = timer.report(summary['inferred'], resumed=summary['resumed'], cached=summary['cached'])
+    summary['timer'] = timer
+    try:
+        with open(os.path.join(inference_folder, 'run_report.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary['report'], f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        emit(f"Error writing run report: {str(e)}")
+    return summary
@@ -0,0 +1,110 @@
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+
+class DiscRecord:
+    """
+    单张图片的检测记录。标注框保存为 (N,4) 的整数数组 [xmin, ymin, xmax, ymax]，
+    置信度和类别保存为长度为N的一维数组，从推理一直传递到排序和裁剪，不再经过txt/xml中转。
+    xyxy 为模型输出的浮点坐标（与 boxes 同序），只用于导出 gen-txt；从清单或XML读取的记录没有该项。
+    """
+    __slots__ = ('image_path', 'width', 'height', 'boxes', 'conf', 'cls', 'xyxy')
+
+    def __init__(self, image_path, width, height, boxes=None, conf=None, cls=None, xyxy=None):
+        self.image_path = image_path
+        self.width = int(width)
+        self.height = int(height)
+        self.boxes = np.zeros((0, 4), dtype=np.int64) if boxes is None else np.asarray(boxes, dtype=np.int64)
+        n = len(self.boxes)
+        self.conf = np.zeros(n, dtype=np.float32) if conf is None else np.asarray(conf, dtype=np.float32)
+        self.cls = np.zeros(n, dtype=np.int64) if cls is None else np.asarray(cls, dtype=np.int64)
+        self.xyxy = None if xyxy is None else np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    @classmethod
+    def from_xyxy(cls, image_path, width, height, pred, scale=(1.0, 1.0)):
+        """
+        由模型输出 (N,6) [x1, y1, x2, y2, conf, cls] 构建记录。
+        scale 为 (sx, sy)，不为1时（降采样解码），先把 x、y 坐标分别换算回原图尺寸并裁剪到图片范围内。
+        坐标先保留两位小数再取整，与原先 txt -> xml 转换得到的整数坐标一致。
+        """
+        pred = np.asarray(pred, dtype=np.float64).reshape(-1, 6)
+        xyxy = pred[:, :4]
+        sx, sy = scale
+        if (sx, sy) != (1.0, 1.0):
+            xyxy = xyxy * (sx, sy, sx, sy)
+            xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, width)
+            xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, height)
+        boxes = np.trunc(np.round(xyxy, 2)).astype(np.int64)
+        return cls(image_path, width, height, boxes, pred[:, 4], pred[:, 5].astype(np.int64), xyxy)
+
+    @classmethod
+    def from_xml(cls, xml_file, image_path=None):
+        """
+        从VOC格式的XML文件读取记录，兼容之前生成的 gen-xml。
+        """
+        root = ET.parse(xml_file).getroot()
+        size_element = root.find('size')
+        boxes, conf, names = [], [], []
+        for obj in root.findall('object'):
+            bbox = obj.find('bndbox')
+            boxes.append([int(bbox.find(k).text) for k in ('xmin', 'ymin', 'xmax', 'ymax')])
+            conf_element = obj.find('confidence')
+            conf.append(float(conf_element.text) if conf_element is not None else 0.0)
+            names.append(int(obj.find('name').text))
+        return cls(image_path, size_element.find('width').text, size_element.find('height').text,
+                   np.array(boxes, dtype=np.int64).reshape(-1, 4), conf, names)
+
+    def take(self, order):
+        """
+        按索引数组返回重新排列后的新记录。
+        """
+        order = np.asarray(order, dtype=np.int64)
+        return DiscRecord(self.image_path, self.width, self.height, self.boxes[order], self.conf[order],
+                          self.cls[order], None if self.xyxy is None else self.xyxy[order])
+
+    def to_tuples(self):
+        """
+        转换为 TreeMain 使用的标注框元组 (name, xmin, ymin, width, height, center_x, center_y, index)。
+        """
+        tuples = []
+        for i, (xmin, ymin, xmax, ymax) in enumerate(self.boxes.tolist()):
+            box_width = xmax - xmin
+            box_height = ymax - ymin
+            tuples.append((str(self.cls[i]), xmin, ymin, box_width, box_height,
+                           xmin + box_width // 2, ymin + box_height // 2, i))
+        return tuples
+
+    def write_txt(self, txt_file_path):
+        """
+        写出 gen-txt：每行 "类别 置信度 x1 y1 x2 y2"，按排序后的顺序；坐标为模型输出的浮点值（保留两位小数），
+        没有浮点坐标的记录（续跑或从XML读取）写出整数坐标。
+        """
+        xyxy = self.boxes if self.xyxy is None else self.xyxy
+        with open(txt_file_path, 'w') as f:
+            for (x1, y1, x2, y2), conf, cls in zip(xyxy.tolist(), self.conf.tolist(), self.cls.tolist()):
+                f.write(f"{cls} {conf:.2f} {x1:.2f} {y1:.2f} {x2:.2f} {y2:.2f}\n")
+
+    def write_xml(self, xml_file_path):
+        root = ET.Element('annotation')
+
+        size = ET.SubElement(root, 'size')
+        ET.SubElement(size, 'width').text = str(self.width)
+        ET.SubElement(size, 'height').text = str(self.height)
+        ET.SubElement(size, 'depth').text = '3'  # Assuming RGB images
+
+        for (x1, y1, x2, y2), conf, cls in zip(self.boxes.tolist(), self.conf.tolist(), self.cls.tolist()):
+            obj = ET.SubElement(root, 'object')
+            ET.SubElement(obj, 'name').text = str(cls)
+            ET.SubElement(obj, 'confidence').text = f"{conf:.2f}"
+            bbox = ET.SubElement(obj, 'bndbox')
+            ET.SubElement(bbox, 'xmin').text = str(x1)
+            ET.SubElement(bbox, 'ymin').text = str(y1)
+            ET.SubElement(bbox, 'xmax').text = str(x2)
+            ET.SubElement(bbox, 'ymax').text = str(y2)
+
+        tree = ET.ElementTree(root)
+        tree.write(xml_file_path, encoding='utf-8', xml_declaration=True)
@@ -0,0 +1,79 @@
+import logging
+import logging.handlers
+import queue
+import re
+import threading
+from collections import deque
+
+from PyQt5.QtCore import QObject, QTimer
+from PyQt5.QtGui import QTextBlockFormat, QTextCharFormat, QTextCursor
+
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+class LogSink(QObject):
+    """
+    界面信息框的缓冲日志。
+
+    write() 可在任意线程调用，只把消息放入缓冲区；定时器按固定间隔把缓冲区中的消息合并为一次编辑写入文本框，
+    文本框最多保留 max_lines 行（环形缓冲），因此无论处理多少张图片，界面开销都保持不变。
+    完整日志通过 QueueHandler/QueueListener 在后台线程写入日志文件。
+    """
+
+    def __init__(self, text_edit, log_file='detection.log', interval_ms=200, max_lines=2000, parent=None):
+        super().__init__(parent)
+        self.text_edit = text_edit
+        self.text_edit.document().setMaximumBlockCount(max_lines)
+        self._pending = deque(maxlen=max_lines)  # 两次刷新之间的消息，超出上限时丢弃最旧的
+        self._lock = threading.Lock()
+
+        # 日志文件在后台线程中写入
+        self.logger = logging.getLogger('DiscSplitter')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self._queue = queue.Queue(-1)
+        self._queue_handler = logging.handlers.QueueHandler(self._queue)
+        self.logger.addHandler(self._queue_handler)
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s',
+                                                    datefmt='%Y-%m-%d %H:%M:%S'))
+        self._listener = logging.handlers.QueueListener(self._queue, file_handler)
+        self._listener.start()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start(interval_ms)
+
+    def write(self, message):
+        with self._lock:
+            self._pending.append(message)
+        self.logger.info(_TAG_RE.sub('', message))
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            messages = list(self._pending)
+            self._pending.clear()
+
+        document = self.text_edit.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        for message in messages:
+            if not document.isEmpty():
+                cursor.insertBlock(QTextBlockFormat(), QTextCharFormat())
+            if message.lstrip().startswith('<'):
+                cursor.insertHtml(message)
+            else:
+                cursor.insertText(message, QTextCharFormat())
+        cursor.endEditBlock()
+
+        scroll_bar = self.text_edit.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
+
+    def close(self):
+        self.timer.stop()
+        self.flush()
+        self.logger.removeHandler(self._queue_handler)
+        self._listener.stop()
@@ -0,0 +1,86 @@
+import os
+
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+from DiscPipeline import load_model
+from RunManifest import file_hash
+
+
+class ModelLoader(QThread):
+    """
+    在后台线程中计算权重哈希并加载（或从缓存恢复）模型；非 pytorch 后端首次使用时会先导出模型。
+    """
+    loaded_signal = pyqtSignal(str, str, str, object)
+    failed_signal = pyqtSignal(str, str, str)
+
+    def __init__(self, model_path, backend='pytorch', parent=None):
+        super().__init__(parent)
+        self.model_path = model_path
+        self.backend = backend
+
+    def run(self):
+        try:
+            model_hash = file_hash(self.model_path)
+            model = load_model(self.model_path, model_hash, backend=self.backend)
+            self.loaded_signal.emit(self.model_path, self.backend, model_hash, model)
+        except Exception as e:
+            self.failed_signal.emit(self.model_path, self.backend, str(e))
+
+
+class ModelManager(QObject):
+    """
+    管理界面当前使用的模型：启动时在后台预加载，下拉框切换模型或推理后端后自动重新加载。
+    只保留最近一次请求的模型，旧的加载结果到达时直接丢弃。
+    """
+    model_ready_signal = pyqtSignal(str)
+    model_failed_signal = pyqtSignal(str, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.model = None
+        self.model_path = None
+        self.model_hash = None
+        self.backend = None
+        self.requested = None  # (model_path, backend)
+        self._loaders = []
+
+    def is_ready(self, model_path, backend='pytorch'):
+        return self.model is not None and (self.model_path, self.backend) == (model_path, backend)
+
+    def request(self, model_path, backend='pytorch'):
+        """
+        请求用 backend 加载 model_path；已加载或正在加载同一模型时不重复加载。
+        """
+        if (model_path, backend) == self.requested:
+            return
+        self.requested = (model_path, backend)
+        if self.is_ready(model_path, backend):
+            self.model_ready_signal.emit(model_path)
+            return
+        if not os.path.isfile(model_path):
+            self.requested = None
+            self.model_failed_signal.emit(model_path, "模型文件不存在")
+            return
+
+        loader = ModelLoader(model_path, backend, self)
+        loader.loaded_signal.connect(self._on_loaded)
+        loader.failed_signal.connect(self._on_failed)
+        loader.finished.connect(lambda: self._loaders.remove(loader))
+        self._loaders.append(loader)
+        loader.start()
+
+    def wait(self):
+        for loader in list(self._loaders):
+            loader.wait()
+
+    def _on_loaded(self, model_path, backend, model_hash, model):
+        if (model_path, backend) != self.requested:
+            return  # 加载期间已切换到其它模型或后端
+        self.model, self.model_path, self.backend, self.model_hash = model, model_path, backend, model_hash
+        self.model_ready_signal.emit(model_path)
+
+    def _on_failed(self, model_path, backend, error):
+        if (model_path, backend) != self.requested:
+            return
+        self.requested = None  # 允许再次尝试加载
+        self.model_failed_signal.emit(model_path, error)
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from DiscRecord import DiscRecord
+
+RESULTS_FILE = 'results.jsonl'
+TABLE_FILE = 'results.npz'
+
+
+def _key(img_path, image_folder):
+    return os.path.relpath(img_path, image_folder).replace(os.sep, '/')
+
+
+def load_results(path):
+    """
+    读取 results.jsonl，按图片合并为 {图片相对路径: 记录字典}。同一图片有多行时后写入的字段覆盖先前的字段。
+    """
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # 程序中途退出时最后一行可能不完整
+            if 'image' in entry:
+                entries.setdefault(entry['image'], {}).update(entry)
+    return entries
+
+
+def load_records(folder, image_folder):
+    """
+    从 DetectResults 中的 results.jsonl 读取已排序的 DiscRecord 列表，代替逐个解析 gen-xml。
+    """
+    records = []
+    for key, entry in load_results(os.path.join(folder, RESULTS_FILE)).items():
+        if 'boxes' in entry:
+            records.append(DiscRecord(os.path.join(image_folder, key), entry['width'], entry['height'],
+                                      entry['boxes'], entry['conf'], entry['cls']))
+    return records
+
+
+def write_table(path, entries):
+    """
+    把合并后的记录写成紧凑的列式表 results.npz：
+    images/width/height 每张图片一项，offsets[i]:offsets[i+1] 是第i张图片在 boxes/conf/cls 中的行范围。
+    """
+    entries = [(key, entry) for key, entry in entries.items() if 'boxes' in entry]
+    counts = [len(entry['boxes']) for _, entry in entries]
+    boxes = [box for _, entry in entries for box in entry['boxes']]
+    tmp_path = path + '.tmp.npz'
+    np.savez_compressed(tmp_path,
+                        images=np.array([key for key, _ in entries], dtype=str),
+                        width=np.array([entry['width'] for _, entry in entries], dtype=np.int32),
+                        height=np.array([entry['height'] for _, entry in entries], dtype=np.int32),
+                        offsets=np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+                        boxes=np.array(boxes, dtype=np.int32).reshape(-1, 4),
+                        conf=np.array([c for _, entry in entries for c in entry['conf']], dtype=np.float32),
+                        cls=np.array([c for _, entry in entries for c in entry['cls']], dtype=np.int16))
+    os.replace(tmp_path, path)
+
+
+def export_voc(folder, image_folder, xml_folder):
+    """
+    由 results.jsonl 导出每张图片的 VOC XML（可选的派生格式），返回写出的文件数量。
+    """
+    os.makedirs(xml_folder, exist_ok=True)
+    records = load_records(folder, image_folder)
+    for record in records:
+        stem = os.path.splitext(os.path.basename(record.image_path))[0]
+        record.write_xml(os.path.join(xml_folder, stem + '.xml'))
+    return len(records)
+
+
+class ResultStore:
+    """
+    一次运行的检测结果，保存在 DetectResults/results.jsonl，代替每张图片一个 XML 文件。
+
+    每行是一条 JSON 记录，以图片相对路径 image 为键，包含图片尺寸、已排序的标注框、置信度、类别和裁剪图片路径；
+    文件只追加写入，可以在处理过程中随时读取。close() 时再由全部记录生成列式表 results.npz，便于批量分析。
+    """
+
+    def __init__(self, folder, image_folder):
+        self.path = os.path.join(folder, RESULTS_FILE)
+        self.table_path = os.path.join(folder, TABLE_FILE)
+        self.image_folder = image_folder
+        self._known = set(load_results(self.path))
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def __contains__(self, img_path):
+        return _key(img_path, self.image_folder) in self._known
+
+    def _append(self, entry):
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._known.add(entry['image'])
+
+    def add(self, record):
+        """
+        追加一张图片已排序的检测记录。
+        """
+        self._append({'image': _key(record.image_path, self.image_folder), 'width': record.width,
+                      'height': record.height, 'boxes': record.boxes.tolist(),
+                      'conf': [round(c, 4) for c in record.conf.tolist()], 'cls': record.cls.tolist()})
+
+    def add_crops(self, img_path, crop_files):
+        """
+        追加一张图片的裁剪图片路径（相对于图片文件夹）。
+        """
+        self._append({'image': _key(img_path, self.image_folder),
+                      'crops': [_key(crop_file, self.image_folder) for crop_file in crop_files]})
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.close()
+        write_table(self.table_path, load_results(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from DiscRecord import DiscRecord
+
+STAGES = ('inferred', 'sorted', 'xml', 'cropped')
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    计算文件内容的 sha256，用于标识模型权重。
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class RunManifest:
+    """
+    记录文件夹中每张图片已完成的处理阶段，保存在 DetectResults/manifest.json。
+    每条记录以图片相对路径为键，并记录文件大小、修改时间、模型哈希和检测设置（见 DiscPipeline.run_settings）；
+    任意一项变化时该图片视为未处理。已排序的标注框也保存在记录中，续跑时无需重新推理。
+    """
+
+    def __init__(self, path, image_folder, model_hash, settings='', save_interval=2.0):
+        self.path = path
+        self.image_folder = image_folder
+        self.model_hash = model_hash
+        self.settings = settings
+        self.save_interval = save_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.time()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f).get('images', {})
+        except (OSError, ValueError):
+            # 清单损坏时从头开始，不影响本次运行
+            self._entries = {}
+
+    def save(self):
+        with self._save_lock:
+            with self._lock:
+                data = json.dumps({'images': self._entries}, ensure_ascii=False)
+                self._dirty = False
+                self._last_save = time.time()
+            # 先写临时文件再替换，程序中途崩溃也不会留下残缺的清单
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+
+    def _key(self, img_path):
+        return os.path.relpath(img_path, self.image_folder).replace(os.sep, '/')
+
+    def _signature(self, img_path):
+        stat = os.stat(img_path)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime, 'model': self.model_hash, 'settings': self.settings}
+
+    def _valid_entry(self, img_path):
+        entry = self._entries.get(self._key(img_path))
+        if entry is None:
+            return None
+        try:
+            signature = self._signature(img_path)
+        except OSError:
+            return None
+        if any(entry.get(k) != v for k, v in signature.items()):
+            return None
+        return entry
+
+    def is_done(self, img_path, stage):
+        with self._lock:
+            entry = self._valid_entry(img_path)
+            return entry is not None and stage in entry['stages']
+
+    def record(self, img_path):
+        """
+        返回已排序的 DiscRecord；图片未完成排序或已发生变化时返回 None。
+        """
+        with self._lock:
+            entry = self._valid_entry(img_path)
+            if entry is None or 'sorted' not in entry['stages']:
+                return None
+            return DiscRecord(img_path, entry['width'], entry['height'], entry['boxes'], entry['conf'], entry['cls'])
+
+    def mark(self, img_path, *stages, record=None):
+        """
+        标记图片已完成的阶段；传入 record 时重新开始该图片的记录并保存标注框。
+        """
+        with self._lock:
+            key = self._key(img_path)
+            if record is not None:
+                entry = self._signature(img_path)
+                entry.update({'stages': [], 'width': record.width, 'height': record.height,
+                              'boxes': record.boxes.tolist(), 'conf': record.conf.tolist(),
+                              'cls': record.cls.tolist()})
+                self._entries[key] = entry
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry['stages'] = [s for s in STAGES if s in entry['stages'] or s in stages]
+            self._dirty = True
+            due = time.time() - self._last_save >= self.save_interval
+        if due:
+            self.save()
+
+    def flush(self):
+        if self._dirty:
+            self.save()
@@ -0,0 +1,100 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# 报告中各阶段的顺序；preprocess/inference/nms 来自 AutoShape 返回的 Detections.times（yolov5 的 Profile）
+STAGES = ('decode', 'preprocess', 'inference', 'nms', 'render', 'sort', 'write', 'xml', 'crop')
+
+
+def percentile(sorted_values, q):
+    """
+    最近秩法百分位数，sorted_values 为已排序的列表。
+    """
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(q / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+class StageTimer:
+    """
+    逐张图片记录检测流水线各阶段的耗时（秒），运行结束后汇总为 p50/p95/max 和吞吐量。
+    按批执行的阶段（推理、NMS等）把整批耗时平均分给批内每张图片。可在多个线程中同时记录。
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._samples = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, count=1):
+        """
+        记录 count 张图片在 stage 阶段共耗时 seconds。
+        """
+        if count <= 0:
+            return
+        with self._lock:
+            self._samples[stage].extend([seconds / count] * count)
+
+    @contextmanager
+    def time(self, stage, count=1):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - t0, count)
+
+    def add_profiles(self, times, count):
+        """
+        记录 Detections.times 中 (预处理, 推理, NMS) 三个 Profile 的耗时。
+        """
+        for stage, profile in zip(('preprocess', 'inference', 'nms'), times):
+            self.add(stage, profile.t, count)
+
+    def merge(self, other):
+        with other._lock:
+            samples = {stage: list(values) for stage, values in other._samples.items()}
+        with self._lock:
+            for stage, values in samples.items():
+                self._samples[stage].extend(values)
+
+    def totals(self):
+        with self._lock:
+            return {stage: sum(values) for stage, values in self._samples.items()}
+
+    def report(self, images, wall_time=None, resumed=0, cached=0):
+        """
+        返回可序列化为JSON的报告：每个阶段的样本数、总耗时、平均值、p50、p95、最大值（毫秒），
+        以及整次运行的墙钟时间和吞吐量（张/秒）。
+        :param images: 实际解码并推理的图片数，吞吐量按它计算
+        :param resumed: 续跑时跳过的图片数，单独列出，不计入吞吐量
+        :param cached: 复用检测缓存的图片数，单独列出，不计入吞吐量
+        """
+        if wall_time is None:
+            wall_time = time.perf_counter() - self.start
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+        stages = {}
+        for stage in [s for s in STAGES if s in samples] + sorted(set(samples) - set(STAGES)):
+            values = samples[stage]
+            stages[stage] = {'count': len(values), 'total_s': round(sum(values), 4),
+                             'mean_ms': round(sum(values) / len(values) * 1e3, 2),
+                             'p50_ms': round(percentile(values, 50) * 1e3, 2),
+                             'p95_ms': round(percentile(values, 95) * 1e3, 2),
+                             'max_ms': round(values[-1] * 1e3, 2)}
+        return {'images': images, 'resumed': resumed, 'cached': cached, 'wall_time_s': round(wall_time, 3),
+                'throughput_ips': round(images / wall_time, 3) if wall_time > 0 else 0.0, 'stages': stages}
+
+
+def format_report(report):
+    """
+    把 report() 的结果格式化为界面信息框中显示的多行文本。
+    """
+    lines = [f"推理 {report['images']} 张图片，用时 {report['wall_time_s']:.1f} 秒，"
+             f"吞吐量 {report['throughput_ips']:.2f} 张/秒（另有跳过 {report['resumed']} 张，复用缓存 {report['cached']} 张）",
+             f"{'阶段':<10}{'p50(ms)':>10}{'p95(ms)':>10}{'max(ms)':>10}{'合计(s)':>10}"]
+    for stage, s in report['stages'].items():
+        lines.append(f"{stage:<10}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['max_ms']:>10.1f}{s['total_s']:>10.2f}")
+    return '\n'.join(lines)
@@ -1,5 +1,10 @@
+import re
+
+import numpy as np
 from PIL import Image
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from AsyncWriter import AsyncWriter
 
 
 def parse_xml(xml_file):
@@ -110,6 +115,54 @@ def sort_boxes_by_side(boxes, dividing_line, width):
     return sorted_boxes
 
 
+def order_boxes_batch(boxes_list, widths):
+    """
+    sort_boxes_by_side 的向量化版本，一次计算多张图片的标注框顺序（先左右，后上下）。
+    结果与 find_geometric_center -> find_dividing_line -> sort_boxes_by_side 完全一致，包括3个及以下标注框的特殊情况。
+
+    :param boxes_list: 每张图片一个 (N,4) 整数数组 [xmin, ymin, xmax, ymax]，N 可以各不相同
+    :param widths: 每张图片的宽度
+    :return: 每张图片一个排序索引数组
+    """
+    counts = np.array([len(boxes) for boxes in boxes_list], dtype=np.int64)
+    if not counts.sum():
+        return [np.zeros(0, dtype=np.int64) for _ in boxes_list]
+    boxes = np.concatenate([np.asarray(b, dtype=np.int64).reshape(-1, 4) for b in boxes_list])
+    group = np.repeat(np.arange(len(boxes_list)), counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    nonempty = counts > 0
+
+    # 与 parse_xml 相同的整数中心点
+    box_width = boxes[:, 2] - boxes[:, 0]
+    center_x = boxes[:, 0] + box_width // 2
+    center_y = boxes[:, 1] + (boxes[:, 3] - boxes[:, 1]) // 2
+
+    # 几何中心：先求整数和再相除，与 sum() / len() 的结果相同
+    sums = np.zeros(len(boxes_list), dtype=np.int64)
+    sums[nonempty] = np.add.reduceat(center_x, starts[nonempty])
+    dividing_line = sums / np.maximum(counts, 1)
+    widths = np.asarray(widths, dtype=np.float64)
+    dividing_line = np.where(dividing_line > widths / 2, widths - dividing_line, dividing_line)[group]
+
+    # 3个及以下标注框且都压在分割线上时，直接从上到下排序
+    min_radius = np.zeros(len(boxes_list))
+    min_radius[nonempty] = np.minimum.reduceat(box_width / 2, starts[nonempty])
+    far = np.zeros(len(boxes_list), dtype=np.int64)
+    np.add.at(far, group, np.abs(center_x - dividing_line) >= min_radius[group])
+    single_column = ((counts <= 3) & (far == 0))[group]
+
+    right = (center_x >= dividing_line) & ~single_column
+    order = np.lexsort((center_y, right, group))  # 稳定排序，y 相同时保持原顺序
+    return [order[start:start + count] - start for start, count in zip(starts, counts)]
+
+
+def order_boxes(boxes, width):
+    """
+    返回单张图片标注框 (N,4) [xmin, ymin, xmax, ymax] 的排序索引（先左右，后上下）。
+    """
+    return order_boxes_batch([boxes], [width])[0]
+
+
 def update_xml(xml_file, sorted_boxes, width, height, output_folder):
     """
     更新XML文件中的标注框顺序，并保存到输出文件夹。
@@ -163,9 +216,8 @@ def process_files(input_folder, output_folder):
         if file_name.endswith('.xml'):
             xml_file = os.path.join(input_folder, file_name)
             boxes, width, height = parse_xml(xml_file)
-            geometric_center_x, _ = find_geometric_center(boxes)
-            dividing_line = find_dividing_line(geometric_center_x, width)
-            sorted_boxes = sort_boxes_by_side(boxes, dividing_line, width)
+            xyxy = [(box[1], box[2], box[1] + box[3], box[2] + box[4]) for box in boxes]
+            sorted_boxes = [boxes[i] for i in order_boxes(xyxy, width)]
             output_file_path = update_xml(xml_file, sorted_boxes, width, height, output_folder)
             # print(f"Processed {file_name} and saved to {output_file_path}")
 
@@ -212,6 +264,24 @@ def extract_number_from_basename(basename):
     return number, new_basename
 
 
+def expected_disc_count(basename):
+    """
+    根据最后一个括号内的编号范围推算圆盘数量，例如 y1-39-(0-1) 为 2；没有编号范围时返回 None。
+
+    :param basename: 不含扩展名的文件名
+    :return: 圆盘数量或 None
+    """
+    number, _ = extract_number_from_basename(basename)
+    if number < 0:
+        return None
+    last_left_parenthesis_index = max(basename.rfind('（'), basename.rfind('('))
+    match = re.match(r'\D*(\d+)\s*[-~～－—]\s*(\d+)', basename[last_left_parenthesis_index + 1:])
+    if match is None:
+        return None
+    first, last = int(match.group(1)), int(match.group(2))
+    return last - first + 1 if last >= first else None
+
+
 # def crop_image_based_on_xml(xml_file, image_file, output_dir, update_info_callback=None):
 #     # 解析XML文件
 #     tree = ET.parse(xml_file)
@@ -249,45 +319,174 @@ def extract_number_from_basename(basename):
 #         # Update the info text in the GUI
 #         if update_info_callback:
 #             update_info_callback(f"<font color='green'>Split finished! saved to{output_image_file}</font>")
-def crop_image_based_on_xml(xml_file, image_file, output_dir, gui_instance=None):
-    # 解析XML文件
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
+def crop_path_for(image_file, output_dir, idx):
+    """
+    按 extract_number_from_basename 的规则构建第 idx 个裁剪图片的输出路径。
+    """
+    base_name, ext = os.path.splitext(os.path.basename(image_file))
+    output_dir1 = str(os.path.join(output_dir, base_name))
+    os.makedirs(output_dir1, exist_ok=True)
+
+    result, new_basename = extract_number_from_basename(base_name)
+
+    if result >= 0:
+        return os.path.join(output_dir1, f"{new_basename}-{idx + result}.jpg")
+    return os.path.join(output_dir1, f"{base_name}-{idx}.jpg")
 
+
+def crop_boxes(image_file, boxes, output_dir, gui_instance=None, writer=None):
+    """
+    按顺序裁剪并保存 boxes 中的每个标注框，boxes 的元素为 (xmin, ymin, xmax, ymax)。
+    传入 AsyncWriter 时图片的编码和保存交给写出线程。返回裁剪图片路径列表。
+    """
     # 加载图像
     img = Image.open(image_file)
+    output_files = []
 
-    # 遍历所有<object>标签
-    for idx, obj in enumerate(root.findall('object')):
-        bndbox = obj.find('bndbox')
-        # 获取当前的边界框坐标
-        xmin = int(bndbox.find('xmin').text)
-        ymin = int(bndbox.find('ymin').text)
-        xmax = int(bndbox.find('xmax').text)
-        ymax = int(bndbox.find('ymax').text)
-
+    for idx, (xmin, ymin, xmax, ymax) in enumerate(boxes):
         # 裁剪图像
         cropped_img = img.crop((xmin, ymin, xmax, ymax))
 
         # 构建输出文件路径
-        base_name, ext = os.path.splitext(os.path.basename(image_file))
-        output_dir1 = str(os.path.join(output_dir, base_name))
-        os.makedirs(output_dir1, exist_ok=True)
-
-        result, new_basename = extract_number_from_basename(base_name)
-
-        if result >= 0:
-            output_image_file = os.path.join(output_dir1, f"{new_basename}-{idx + result}.jpg")
-        else:
-            output_image_file = os.path.join(output_dir1, f"{base_name}-{idx}.jpg")
+        output_image_file = crop_path_for(image_file, output_dir, idx)
 
         # 保存裁剪后的图像
-        cropped_img.save(output_image_file)
+        if writer is not None:
+            writer.submit(cropped_img.save, output_image_file)
+        else:
+            cropped_img.save(output_image_file)
+        output_files.append(output_image_file)
 
         # 发送信号更新文本框信息
         if gui_instance:
             gui_instance.image_cropped_signal.emit(f"已裁剪图片: {output_image_file}")
 
+    return output_files
+
+
+def save_array(cropped, output_image_file):
+    Image.fromarray(cropped).save(output_image_file)
+
+
+def crop_array(img, boxes, image_file, output_dir, writer=None):
+    """
+    从已解码的RGB数组中裁剪标注框并保存，命名规则与 crop_boxes 相同，避免再次读取原图。
+    传入 AsyncWriter 时复制裁剪区域后交给写出线程保存，原图数组可以尽早释放。返回裁剪图片路径列表。
+    """
+    height, width = img.shape[:2]
+    output_files = []
+    for idx, (xmin, ymin, xmax, ymax) in enumerate(boxes):
+        cropped = img[max(ymin, 0):min(ymax, height), max(xmin, 0):min(xmax, width)]
+        output_image_file = crop_path_for(image_file, output_dir, idx)
+        if writer is not None:
+            writer.submit(save_array, cropped.copy(), output_image_file)
+        else:
+            save_array(cropped, output_image_file)
+        output_files.append(output_image_file)
+    return output_files
+
+
+def crop_image_based_on_xml(xml_file, image_file, output_dir, gui_instance=None, writer=None):
+    # 解析XML文件
+    tree = ET.parse(xml_file)
+    root = tree.getroot()
+
+    # 获取所有<object>标签的边界框坐标
+    boxes = []
+    for obj in root.findall('object'):
+        bndbox = obj.find('bndbox')
+        boxes.append((int(bndbox.find('xmin').text), int(bndbox.find('ymin').text),
+                      int(bndbox.find('xmax').text), int(bndbox.find('ymax').text)))
+
+    return crop_boxes(image_file, boxes, output_dir, gui_instance, writer)
+
+
+_job_writer = None  # 每个裁剪进程各自的写出线程
+
+
+def _run_crop_job(crop_fn, image_file, *args):
+    """
+    在写出线程中保存裁剪图片，任务返回前等待写完，返回 (image_file, 裁剪图片路径列表, 错误信息)。
+    """
+    global _job_writer
+    if _job_writer is None:
+        _job_writer = AsyncWriter(threads=2)
+    try:
+        output_files = crop_fn(*args, writer=_job_writer)
+    except Exception as e:
+        _job_writer.flush()
+        return image_file, [], str(e)
+    errors = _job_writer.flush()
+    return image_file, output_files, str(errors[0]) if errors else None
+
+
+def _crop_xml_job(job):
+    """
+    进程池任务：根据XML裁剪一张图片。
+    """
+    xml_file, image_file, output_dir = job
+    return _run_crop_job(crop_image_based_on_xml, image_file, xml_file, image_file, output_dir)
+
+
+def _crop_boxes_job(job):
+    """
+    进程池任务：根据标注框列表裁剪一张图片。
+    """
+    image_file, boxes, output_dir = job
+    return _run_crop_job(crop_boxes, image_file, image_file, boxes, output_dir)
+
+
+def run_crop_jobs(job_fn, jobs, workers=None, gui_instance=None, on_progress=None, on_result=None):
+    """
+    用进程池并行执行裁剪任务。结果按任务顺序返回，因此进度和裁剪信息也按原顺序发送到界面。
+
+    :param job_fn: 可被 pickle 的顶层任务函数
+    :param jobs: 任务参数列表
+    :param workers: 进程数量，None 表示使用全部CPU核心，1 表示在当前进程中串行执行
+    :param gui_instance: 具有 image_cropped_signal 信号的对象
+    :param on_progress: 回调 on_progress(done, total)，每张图片裁剪完成后调用
+    :param on_result: 回调 on_result(image_file, output_files, error)，每张图片裁剪完成后调用
+    :return: 裁剪失败的图片数量
+    """
+    total = len(jobs)
+    workers = max(1, min(workers or os.cpu_count() or 1, total or 1))
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    results = executor.map(job_fn, jobs) if executor else map(job_fn, jobs)
+    failed = 0
+    try:
+        for done, (image_file, output_files, error) in enumerate(results, 1):
+            if gui_instance:
+                for output_image_file in output_files:
+                    gui_instance.image_cropped_signal.emit(f"已裁剪图片: {output_image_file}")
+                if error:
+                    gui_instance.image_cropped_signal.emit(f"Error cropping {os.path.basename(image_file)}: {error}")
+            failed += bool(error)
+            if on_result:
+                on_result(image_file, output_files, error)
+            if on_progress:
+                on_progress(done, total)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    return failed
+
+
+def order_records(records):
+    """
+    一次计算多条 DiscRecord 的标注框顺序，返回排序后的新记录列表。
+    """
+    orders = order_boxes_batch([record.boxes for record in records], [record.width for record in records])
+    return [record.take(order) for record, order in zip(records, orders)]
+
+
+def crop_records(records, output_dir, gui_instance=None, workers=None, on_progress=None, on_result=None):
+    """
+    直接根据内存中已排序的 DiscRecord 并行裁剪图片，无需再解析XML。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(record.image_path, record.boxes.tolist(), output_dir) for record in records]
+    return run_crop_jobs(_crop_boxes_job, jobs, workers, gui_instance, on_progress, on_result)
+
 
 import os
 
@@ -297,16 +496,19 @@ def main1(input_folder, output_folder):
     process_files(input_folder, output_folder)
 
 
-def main2(input_dir, xml_dir, output_dir, gui_instance):
+def main2(input_dir, xml_dir, output_dir, gui_instance, workers=None, on_progress=None):
+    """标签裁剪，多进程并行"""
     # 创建输出目录（如果不存在）
     os.makedirs(output_dir, exist_ok=True)
 
     # 遍历XML文件夹中的所有XML文件
+    jobs = []
     for file_name in os.listdir(xml_dir):
         if file_name.endswith('.xml'):
             xml_file = os.path.join(xml_dir, file_name)
             image_file = os.path.join(input_dir, file_name.replace('.xml', '.jpg'))
-            crop_image_based_on_xml(xml_file, image_file, output_dir, gui_instance)
+            jobs.append((xml_file, image_file, output_dir))
+    return run_crop_jobs(_crop_xml_job, jobs, workers, gui_instance, on_progress)
 
 
 # def main3():
@@ -1,16 +1,15 @@
 import os
-import torch
 import ctypes
 
 from PyQt5.QtGui import QFont, QIcon
-from PyQt5.QtWidgets import QApplication, QMainWindow, QPushButton, QLabel, QVBoxLayout, QWidget, \
-    QComboBox, QFileDialog, QGroupBox, QProgressBar, QTextEdit
+from PyQt5.QtWidgets import QApplication, QMainWindow, QPushButton, QLabel, QVBoxLayout, QHBoxLayout, QWidget, \
+    QComboBox, QFileDialog, QGroupBox, QProgressBar, QTextEdit, QSpinBox, QCheckBox
 from PyQt5.QtCore import Qt, QDir
 import sys
-from PIL import Image
-import cv2
-import xml.etree.ElementTree as ET
-from TreeMain import main1, main2
+from DetectWorker import DetectWorker, SplitWorker
+from ModelManager import ModelManager
+from LogSink import LogSink
+from DiscPipeline import MIN_TILE, list_images
 from PyQt5.QtCore import pyqtSignal
 
 
@@ -33,6 +32,16 @@ class YOLOv5GUI(QMainWindow):
         # 初始化状态
         self.image_files = []  # 存储选择的图片文件列表
         self.model = None  # 用于存储加载的YOLOv5模型
+        self.detect_worker = None  # 后台检测线程
+        self.split_worker = None  # 后台裁剪线程
+        self.records = []  # 最近一次检测得到的已排序检测记录
+        self.model_hash, self.settings = None, ''  # 最近一次检测的续跑清单标识，分割时跳过已裁剪的图片
+        self.pending_detect = False  # 模型加载完成后是否自动开始检测
+
+        # 模型管理：后台预加载，切换模型时自动重新加载
+        self.model_manager = ModelManager(self)
+        self.model_manager.model_ready_signal.connect(self.on_model_ready)
+        self.model_manager.model_failed_signal.connect(self.on_model_failed)
 
         # 创建主部件和布局
         central_widget = QWidget()
@@ -56,17 +65,98 @@ class YOLOv5GUI(QMainWindow):
         # 模型选择部分
         model_group = QGroupBox("Model")
         model_group.setFixedWidth(350)
-        model_group.setFixedHeight(200)
+        model_group.setFixedHeight(510)
         model_layout = QVBoxLayout()
         self.model_combobox = QComboBox()
         self.populate_model_combobox()
         model_layout.addWidget(self.model_combobox)
 
+        # 推理后端：非 PyTorch 后端首次使用时自动导出并缓存到 pt/cache
+        backend_layout = QHBoxLayout()
+        backend_layout.addWidget(QLabel("推理后端"))
+        self.backend_combobox = QComboBox()
+        self.backend_combobox.addItem("PyTorch", 'pytorch')
+        self.backend_combobox.addItem("ONNX Runtime", 'onnx')
+        self.backend_combobox.addItem("OpenVINO", 'openvino')
+        self.backend_combobox.addItem("TorchScript", 'torchscript')
+        backend_layout.addWidget(self.backend_combobox)
+        model_layout.addLayout(backend_layout)
+
+        # 批大小设置：每次推理同时处理的图片数量
+        batch_layout = QHBoxLayout()
+        batch_layout.addWidget(QLabel("批大小"))
+        self.batch_size_spinbox = QSpinBox()
+        self.batch_size_spinbox.setRange(1, 64)
+        self.batch_size_spinbox.setValue(4)
+        batch_layout.addWidget(self.batch_size_spinbox)
+        model_layout.addLayout(batch_layout)
+
+        # 检测并分割：直接从推理时解码的图片裁剪，省去再次读取原图
+        self.fused_split_checkbox = QCheckBox("检测后直接分割")
+        model_layout.addWidget(self.fused_split_checkbox)
+
+        # 续跑：跳过清单中已处理且未修改的图片
+        self.resume_checkbox = QCheckBox("跳过已处理的图片")
+        self.resume_checkbox.setChecked(True)
+        model_layout.addWidget(self.resume_checkbox)
+
+        # 逐图导出：检测结果已汇总在 results.jsonl，需要时才额外写出每张图片的 gen-txt 和 gen-xml
+        self.export_checkbox = QCheckBox("导出逐图 txt/XML")
+        model_layout.addWidget(self.export_checkbox)
+
+        # 两阶段推理：先用320推理，结果不确定的图片再用640推理
+        self.cascade_checkbox = QCheckBox("两阶段推理（先低分辨率，必要时重新推理）")
+        model_layout.addWidget(self.cascade_checkbox)
+
+        # 检测缓存：内容相同的图片直接复用之前的检测结果
+        self.cache_checkbox = QCheckBox("复用重复图片的检测结果")
+        self.cache_checkbox.setChecked(True)
+        model_layout.addWidget(self.cache_checkbox)
+
+        # 快速解码：按模型输入尺寸降采样解码大图
+        self.fast_decode_checkbox = QCheckBox("快速解码（降采样读取大图）")
+        model_layout.addWidget(self.fast_decode_checkbox)
+
+        # 推理结果图片：不保存、只保存缩略图或保存原尺寸标注图
+        render_layout = QHBoxLayout()
+        render_layout.addWidget(QLabel("结果图片"))
+        self.render_combobox = QComboBox()
+        self.render_combobox.addItem("原尺寸", 'full')
+        self.render_combobox.addItem("缩略图", 'thumbnail')
+        self.render_combobox.addItem("不保存", 'none')
+        render_layout.addWidget(self.render_combobox)
+        model_layout.addLayout(render_layout)
+
+        # 分块推理：高分辨率图片按块推理后合并检测框，不勾选时整图推理
+        tile_layout = QHBoxLayout()
+        self.tile_checkbox = QCheckBox("分块推理")
+        tile_layout.addWidget(self.tile_checkbox)
+        self.tile_spinbox = QSpinBox()
+        self.tile_spinbox.setRange(MIN_TILE, 2048)
+        self.tile_spinbox.setSingleStep(64)
+        self.tile_spinbox.setValue(640)
+        self.tile_spinbox.setEnabled(False)
+        self.tile_checkbox.toggled.connect(self.tile_spinbox.setEnabled)
+        tile_layout.addWidget(self.tile_spinbox)
+        model_layout.addLayout(tile_layout)
+
         # Detect按钮
         self.detect_button = QPushButton("Detect")
         self.detect_button.clicked.connect(self.detect)
         model_layout.addWidget(self.detect_button)
 
+        # 暂停和取消按钮
+        control_layout = QHBoxLayout()
+        self.pause_button = QPushButton("暂停")
+        self.pause_button.clicked.connect(self.toggle_pause)
+        self.pause_button.setEnabled(False)
+        control_layout.addWidget(self.pause_button)
+        self.cancel_button = QPushButton("取消")
+        self.cancel_button.clicked.connect(self.cancel_detect)
+        self.cancel_button.setEnabled(False)
+        control_layout.addWidget(self.cancel_button)
+        model_layout.addLayout(control_layout)
+
         # 进度条
         self.progress_bar = QProgressBar()
         model_layout.addWidget(self.progress_bar)
@@ -78,6 +168,15 @@ class YOLOv5GUI(QMainWindow):
         self.image_count_label = QLabel()
         left_panel.addWidget(self.image_count_label)
 
+        # 裁剪进程数设置
+        workers_layout = QHBoxLayout()
+        workers_layout.addWidget(QLabel("裁剪进程数"))
+        self.crop_workers_spinbox = QSpinBox()
+        self.crop_workers_spinbox.setRange(1, os.cpu_count() or 1)
+        self.crop_workers_spinbox.setValue(os.cpu_count() or 1)
+        workers_layout.addWidget(self.crop_workers_spinbox)
+        left_panel.addLayout(workers_layout)
+
         self.start_button = QPushButton("Split it！")
         self.start_button.clicked.connect(self.start_split)
         self.start_button.setFixedSize(120, 40)
@@ -92,10 +191,17 @@ class YOLOv5GUI(QMainWindow):
         self.info_text_edit.setReadOnly(True)
         self.info_text_edit.setFixedHeight(400)
         left_panel.addWidget(self.info_text_edit)
+        # 信息按固定频率批量刷新到文本框，并异步写入日志文件
+        self.log_sink = LogSink(self.info_text_edit, parent=self)
 
         main_layout.addLayout(left_panel)
         self.setFocusPolicy(Qt.NoFocus)
 
+        # 启动时预加载当前选择的模型
+        self.model_combobox.currentTextChanged.connect(self.on_model_selected)
+        self.backend_combobox.currentIndexChanged.connect(self.on_model_selected)
+        self.on_model_selected(self.model_combobox.currentText())
+
     def on_image_cropped(self, message):
         self.append_to_info_text(message)
 
@@ -113,8 +219,7 @@ class YOLOv5GUI(QMainWindow):
     def open_folder(self):
         folder_path = QFileDialog.getExistingDirectory(self, "选择图片文件夹", QDir.homePath())
         if folder_path:
-            self.image_files = [os.path.join(folder_path, f) for f in os.listdir(folder_path)
-                                if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))]
+            self.image_files = list_images(folder_path)
             if self.image_files:
                 self.image_count_label.setText(f"共 {len(self.image_files)} 张图片")
             else:
@@ -125,147 +230,171 @@ class YOLOv5GUI(QMainWindow):
         if not self.image_files:
             self.append_to_info_text("没有选择图片文件。")
             return
+        if self.detect_worker is not None and self.detect_worker.isRunning():
+            self.append_to_info_text("检测正在进行中，请稍候。")
+            return
 
-        try:
-            # Assuming your model is in a subfolder 'pt' within your project
-            model_dir = "pt"
-            selected_model_name = self.model_combobox.currentText()
-            selected_model_path = os.path.join(model_dir, selected_model_name)
-
-            # Load the YOLOv5 model
-            if self.model is None:
-                self.model = torch.hub.load('yolov5-master', 'custom', path=selected_model_path,force_reload=True,source='local')
-                self.model.eval()  # Set the model to evaluation mode
-
-            # Ensure model loaded successfully
-            if self.model is not None:
-                self.append_to_info_text("模型加载成功")
-            else:
-                self.append_to_info_text("模型加载失败")
-                return
-
-            # Create folders
-            inference_folder = os.path.join(os.path.dirname(self.image_files[0]), 'DetectResults')
-            os.makedirs(inference_folder, exist_ok=True)
-            self.NeedPath = inference_folder
-            txt_folder = os.path.join(inference_folder, 'gen-txt')
-            os.makedirs(txt_folder, exist_ok=True)
-            self.xml_folder = os.path.join(inference_folder, 'gen-xml')
-            os.makedirs(self.xml_folder, exist_ok=True)
-
-            # Batch inference
-            num_files = len(self.image_files)
-            self.progress_bar.setRange(0, num_files)
-            self.progress_bar.setValue(0)
-
-            for i, img_path in enumerate(self.image_files):
-                try:
-                    # Convert OpenCV image to PIL Image
-                    img = cv2.imread(img_path)
-                    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                    img_pil = Image.fromarray(img)
-
-                    # Perform inference
-                    results = self.model(img_pil)
-                    W, H = img.shape[1], img.shape[0]  # Update dimensions
-
-                    # Save result image
-                    result_img = results.render()[0]
-                    inferred_image_path = os.path.join(inference_folder, os.path.basename(img_path))
-                    cv2.imwrite(inferred_image_path, cv2.cvtColor(result_img, cv2.COLOR_RGB2BGR))
-
-                    # Save bbox txt file
-                    txt_file_path = os.path.join(txt_folder,
-                                                 os.path.basename(img_path).replace('.jpg', '.txt').replace('.png',
-                                                                                                            '.txt'))
-                    with open(txt_file_path, 'w') as f:
-                        for *box, conf, cls in results.xyxy[0].tolist():
-                            f.write(f"{int(cls)} {conf:.2f} {box[0]:.2f} {box[1]:.2f} {box[2]:.2f} {box[3]:.2f}\n")
-
-                    self.append_to_info_text(f"推理后的图片保存到: {inferred_image_path}")
-
-                    # Save dimensions for use in XML conversion
-                    self.W = W
-                    self.H = H
-
-                    # Convert txt to xml
-                    xml_file_path = os.path.join(self.xml_folder,
-                                                 os.path.basename(txt_file_path).replace('.txt', '.xml'))
-                    self.convert_txt_to_xml(txt_file_path, xml_file_path)
-
-                    # Update progress bar
-                    self.progress_bar.setValue(i + 1)
-
-                except Exception as img_error:
-                    error_message = f"Error processing image {os.path.basename(img_path)}: {str(img_error)}"
-                    self.append_to_info_text(error_message)
+        selected_model_path = self.selected_model_path()
+        backend = self.backend_combobox.currentData()
+        if not self.model_manager.is_ready(selected_model_path, backend):
+            # 模型还在后台加载，加载完成后自动开始检测
+            self.pending_detect = True
+            self.model_manager.request(selected_model_path, backend)
+            self.append_to_info_text("模型加载中，加载完成后自动开始检测...")
+            return
 
-            self.info_text_edit.setTextColor(Qt.green)
-            self.append_to_info_text("推理完成！请split")
-            self.info_text_edit.setTextColor(Qt.black)  # Reset to default color
+        num_files = len(self.image_files)
+        self.progress_bar.setRange(0, num_files)
+        self.progress_bar.setValue(0)
+
+        # 在后台线程中执行检测，界面保持响应
+        self.detect_worker = DetectWorker(self.image_files, selected_model_path, model=self.model_manager.model,
+                                          model_hash=self.model_manager.model_hash,
+                                          batch_size=self.batch_size_spinbox.value(),
+                                          split=self.fused_split_checkbox.isChecked(),
+                                          resume=self.resume_checkbox.isChecked(),
+                                          fast_decode_size=640 if self.fast_decode_checkbox.isChecked() else None,
+                                          render=self.render_combobox.currentData(),
+                                          tile=self.tile_spinbox.value() if self.tile_checkbox.isChecked() else None,
+                                          use_cache=self.cache_checkbox.isChecked(),
+                                          cascade_size=320 if self.cascade_checkbox.isChecked() else None,
+                                          export_files=self.export_checkbox.isChecked(),
+                                          backend=backend)
+        self.detect_worker.message_signal.connect(self.append_to_info_text)
+        self.detect_worker.progress_signal.connect(self.on_detect_progress)
+        self.detect_worker.finished_signal.connect(self.on_detect_finished)
+        self.set_detect_running(True)
+        self.detect_worker.start()
+
+    def selected_model_path(self):
+        # Assuming your model is in a subfolder 'pt' within your project
+        return os.path.join("pt", self.model_combobox.currentText())
+
+    def on_model_selected(self, *args):
+        self.model = None
+        self.model_manager.request(self.selected_model_path(), self.backend_combobox.currentData())
+
+    def on_model_ready(self, model_path):
+        self.model = self.model_manager.model
+        self.append_to_info_text(f"模型加载成功: {os.path.basename(model_path)} ({self.model_manager.backend})")
+        if self.pending_detect and model_path == self.selected_model_path():
+            self.pending_detect = False
+            self.detect()
+
+    def on_model_failed(self, model_path, error):
+        self.pending_detect = False
+        self.append_to_info_text(f"模型加载失败: {os.path.basename(model_path)} ({error})")
+
+    def on_detect_progress(self, done, total):
+        self.progress_bar.setValue(done)
+
+    def on_detect_finished(self, summary):
+        self.set_detect_running(False)
+        if summary.get('xml_folder'):
+            self.NeedPath = summary['inference_folder']
+            self.xml_folder = summary['xml_folder']
+            self.records = summary.get('records', [])
+            self.model_hash, self.settings = summary.get('model_hash'), summary.get('settings', '')
+            if summary.get('W') is not None:
+                # 记录图片尺寸，分割前据此确认已完成检测
+                self.W = summary['W']
+                self.H = summary['H']
+
+        if summary.get('cancelled'):
+            self.append_to_info_text("检测已取消")
+        elif summary.get('crop_folder'):
+            html_text = '<font color="green" size="24">圆盘分割成功！</font>'
+            self.append_to_info_text(html_text)
+        elif summary.get('xml_folder'):
+            self.append_to_info_text('<font color="green">推理完成！请split</font>')
 
-        except Exception as e:
-            error_message = f"Error during detection: {str(e)}"
-            self.append_to_info_text(error_message)
+    def toggle_pause(self):
+        if self.detect_worker is None or not self.detect_worker.isRunning():
+            return
+        if self.detect_worker.control.paused:
+            self.detect_worker.resume()
+            self.pause_button.setText("暂停")
+        else:
+            self.detect_worker.pause()
+            self.pause_button.setText("继续")
+
+    def cancel_detect(self):
+        if self.detect_worker is not None and self.detect_worker.isRunning():
+            self.detect_worker.cancel()
+            self.append_to_info_text("正在取消检测...")
+
+    def set_detect_running(self, running):
+        self.detect_button.setEnabled(not running)
+        self.batch_size_spinbox.setEnabled(not running)
+        self.fused_split_checkbox.setEnabled(not running)
+        self.resume_checkbox.setEnabled(not running)
+        self.fast_decode_checkbox.setEnabled(not running)
+        self.render_combobox.setEnabled(not running)
+        self.backend_combobox.setEnabled(not running)
+        self.tile_checkbox.setEnabled(not running)
+        self.tile_spinbox.setEnabled(not running and self.tile_checkbox.isChecked())
+        self.cache_checkbox.setEnabled(not running)
+        self.cascade_checkbox.setEnabled(not running)
+        self.export_checkbox.setEnabled(not running)
+        self.start_button.setEnabled(not running)
+        self.pause_button.setEnabled(running)
+        self.cancel_button.setEnabled(running)
+        self.pause_button.setText("暂停")
+
+    def closeEvent(self, event):
+        if self.detect_worker is not None and self.detect_worker.isRunning():
+            self.detect_worker.cancel()
+            self.detect_worker.wait()
+        if self.split_worker is not None and self.split_worker.isRunning():
+            self.split_worker.wait()
+        self.model_manager.wait()
+        self.log_sink.close()
+        super().closeEvent(event)
 
     def start_split(self):
         try:
             if not hasattr(self, 'W') or not hasattr(self, 'H'):
                 raise ValueError("Image dimensions not set. Run detection first.")
-            #
-            # print(f"XML Folder: {self.xml_folder}")
+            if self.split_worker is not None and self.split_worker.isRunning():
+                self.append_to_info_text("分割正在进行中，请稍候。")
+                return
             crop_folder = os.path.join(self.NeedPath, "crop")
             os.makedirs(crop_folder, exist_ok=True)
-            # print(f"Crop Folder: {crop_folder}")
-            # print(f"Input Folder: {self.input_folder}")
-            #
-            # # Pass the append_to_info_text method as a callback
-            # main1(self.xml_folder, self.xml_folder)
-            # main2(self.input_folder, self.xml_folder, crop_folder, self.append_to_info_text)
 
-            main1(self.xml_folder, self.xml_folder)
-            main2(self.input_folder, self.xml_folder, crop_folder, gui_instance=self)
+            num_files = len(self.records) if self.records else len(os.listdir(self.xml_folder))
+            self.progress_bar.setRange(0, num_files)
+            self.progress_bar.setValue(0)
 
-            html_text = '<font color="green" size="24">圆盘分割成功！</font>'
-            self.append_to_info_text(html_text)
+            # 在后台线程中多进程裁剪，界面保持响应
+            self.split_worker = SplitWorker(crop_folder, records=self.records, input_folder=self.input_folder,
+                                            xml_folder=self.xml_folder, workers=self.crop_workers_spinbox.value(),
+                                            model_hash=self.model_hash, settings=self.settings)
+            self.split_worker.image_cropped_signal.connect(self.on_image_cropped)
+            self.split_worker.progress_signal.connect(self.on_split_progress)
+            self.split_worker.finished_signal.connect(self.on_split_finished)
+            self.set_split_running(True)
+            self.split_worker.start()
         except Exception as e:
             self.append_to_info_text(f"Error during split: {str(e)}")
             print(f"Error during split: {str(e)}")
 
-    def append_to_info_text(self, message):
-        self.info_text_edit.append(message)
+    def on_split_progress(self, done, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
 
-    def convert_txt_to_xml(self, txt_file_path, xml_file_path):
-        try:
-            root = ET.Element('annotation')
-
-            # Add image size information
-            size = ET.SubElement(root, 'size')
-            ET.SubElement(size, 'width').text = str(self.W)
-            ET.SubElement(size, 'height').text = str(self.H)
-            ET.SubElement(size, 'depth').text = '3'  # Assuming RGB images
-
-            # Parse the TXT file
-            with open(txt_file_path, 'r') as f:
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) == 6:
-                        cls, conf, x1, y1, x2, y2 = map(float, parts)
-                        obj = ET.SubElement(root, 'object')
-                        ET.SubElement(obj, 'name').text = str(int(cls))
-                        ET.SubElement(obj, 'confidence').text = f"{conf:.2f}"
-                        bbox = ET.SubElement(obj, 'bndbox')
-                        ET.SubElement(bbox, 'xmin').text = str(int(x1))
-                        ET.SubElement(bbox, 'ymin').text = str(int(y1))
-                        ET.SubElement(bbox, 'xmax').text = str(int(x2))
-                        ET.SubElement(bbox, 'ymax').text = str(int(y2))
-
-            # Write the XML file
-            tree = ET.ElementTree(root)
-            tree.write(xml_file_path, encoding='utf-8', xml_declaration=True)
+    def on_split_finished(self, success):
+        self.set_split_running(False)
+        if success:
+            html_text = '<font color="green" size="24">圆盘分割成功！</font>'
+            self.append_to_info_text(html_text)
 
-        except Exception as e:
-            self.append_to_info_text(f"Error converting {txt_file_path} to XML: {str(e)}")
+    def set_split_running(self, running):
+        self.start_button.setEnabled(not running)
+        self.detect_button.setEnabled(not running)
+        self.crop_workers_spinbox.setEnabled(not running)
+
+    def append_to_info_text(self, message):
+        self.log_sink.write(message)
 
     def trigger_image_cropped_signal(self, message):
         self.image_cropped_signal.emit(message)
@@ -273,8 +402,9 @@ class YOLOv5GUI(QMainWindow):
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    myappid = 'mycompany.myproduct.subproduct.version'
-    ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
+    if sys.platform == 'win32':
+        myappid = 'mycompany.myproduct.subproduct.version'
+        ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
     window = YOLOv5GUI()
     window.show()
     sys.exit(app.exec_())
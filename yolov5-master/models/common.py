@@ -3,19 +3,25 @@
 
 import ast
 import contextlib
+import hashlib
+import io
 import json
 import math
 import platform
+import queue
+import threading
 import warnings
 import zipfile
 from collections import OrderedDict, namedtuple
 from copy import copy
+from functools import cached_property
+from itertools import islice
+from multiprocessing.pool import ThreadPool
 from pathlib import Path
 from urllib.parse import urlparse
 
 import cv2
 import numpy as np
-import pandas as pd
 import requests
 import torch
 import torch.nn as nn
@@ -48,8 +54,10 @@ from utils.general import (
     increment_path,
     is_jupyter,
     make_divisible,
+    merge_tiled_boxes,
     non_max_suppression,
     scale_boxes,
+    tile_origins,
     xywh2xyxy,
     xyxy2xywh,
     yaml_load,
@@ -786,6 +794,11 @@ class AutoShape(nn.Module):
     classes = None  # (optional list) filter by class, i.e. = [0, 15, 16] for COCO persons, cats and dogs
     max_det = 1000  # maximum number of detections per image
     amp = False  # Automatic Mixed Precision (AMP) inference
+    cache = None  # (optional DetectionCache) reuse detections of previously seen images
+    cache_tag = ""  # model identifier mixed into cache keys, i.e. weights hash
+    bucket = False  # group list inputs by letterboxed shape and run one forward per shape instead of padding to max
+    workers = 0  # threads for loading and letterboxing list inputs, 0 for serial pre-processing
+    keep_ims = None  # images retained in Detections.ims: None full size, 0 none, N downscaled to N pixels (see shrink)
 
     def __init__(self, model, verbose=True):
         """Initializes YOLOv5 model for inference, setting up attributes and preparing model for evaluation."""
@@ -841,84 +854,382 @@ class AutoShape(nn.Module):
             if isinstance(ims, torch.Tensor):  # torch
                 with amp.autocast(autocast):
                     return self.model(ims.to(p.device).type_as(p), augment=augment)  # inference
+            if self.cache is not None:
+                return self._forward_cached(ims, size, augment, profile)
 
             # Pre-process
             n, ims = (len(ims), list(ims)) if isinstance(ims, (list, tuple)) else (1, [ims])  # number, list of images
-            shape0, shape1, files = [], [], []  # image and inference shapes, filenames
-            for i, im in enumerate(ims):
-                f = f"image{i}"  # filename
-                if isinstance(im, (str, Path)):  # filename or uri
-                    im, f = Image.open(requests.get(im, stream=True).raw if str(im).startswith("http") else im), im
-                    im = np.asarray(exif_transpose(im))
-                elif isinstance(im, Image.Image):  # PIL Image
-                    im, f = np.asarray(exif_transpose(im)), getattr(im, "filename", f) or f
-                files.append(Path(f).with_suffix(".jpg").name)
-                if im.shape[0] < 5:  # image in CHW
-                    im = im.transpose((1, 2, 0))  # reverse dataloader .transpose(2, 0, 1)
-                im = im[..., :3] if im.ndim == 3 else cv2.cvtColor(im, cv2.COLOR_GRAY2BGR)  # enforce 3ch input
-                s = im.shape[:2]  # HWC
-                shape0.append(s)  # image shape
-                g = max(size) / max(s)  # gain
-                shape1.append([int(y * g) for y in s])
-                ims[i] = im if im.data.contiguous else np.ascontiguousarray(im)  # update
-            shape1 = [make_divisible(x, self.stride) for x in np.array(shape1).max(0)]  # inf shape
-            x = [letterbox(im, shape1, auto=False)[0] for im in ims]  # pad
-            x = np.ascontiguousarray(np.array(x).transpose((0, 3, 1, 2)))  # stack and BHWC to BCHW
-            x = torch.from_numpy(x).to(p.device).type_as(p) / 255  # uint8 to fp16/32
-
+            pool = ThreadPool(min(self.workers, n)) if self.workers > 1 and n > 1 else None
+            run = pool.map if pool else lambda fn, it: list(map(fn, it))  # parallel or serial map
+            try:
+                ims, files, shape0, shape1 = map(list, zip(*run(lambda i: self._load(i, ims[i], size), range(n))))
+                batches = self._batches(ims, shape1, p, run)
+            finally:
+                if pool:
+                    pool.close()
+
+        y = [None] * n
         with amp.autocast(autocast):
-            # Inference
-            with dt[1]:
-                y = self.model(x, augment=augment)  # forward
+            for idx, shape, x in batches:
+                # Inference
+                with dt[1]:
+                    pred = self.model(x, augment=augment)  # forward
+
+                # Post-process
+                with dt[2]:
+                    pred = non_max_suppression(
+                        pred if self.dmb else pred[0],
+                        self.conf,
+                        self.iou,
+                        self.classes,
+                        self.agnostic,
+                        self.multi_label,
+                        max_det=self.max_det,
+                    )  # NMS
+                    for i, det in zip(idx, pred):
+                        scale_boxes(shape, det[:, :4], shape0[i])
+                        y[i] = det  # restore input order
+
+            s = (n, 3, *map(int, np.array([shape for _, shape, _ in batches]).max(0)))  # largest inference shape
+            return Detections(ims, y, files, dt, self.names, s).shrink(self.keep_ims)
+
+    @staticmethod
+    def _load(i, im, size):
+        """Loads input `i` as a contiguous HWC 3-channel array, returning (im, filename, shape0, unpadded shape1)."""
+        f = f"image{i}"  # filename
+        if isinstance(im, (str, Path)):  # filename or uri
+            im, f = Image.open(requests.get(im, stream=True).raw if str(im).startswith("http") else im), im
+            im = np.asarray(exif_transpose(im))
+        elif isinstance(im, Image.Image):  # PIL Image
+            im, f = np.asarray(exif_transpose(im)), getattr(im, "filename", f) or f
+        if im.shape[0] < 5:  # image in CHW
+            im = im.transpose((1, 2, 0))  # reverse dataloader .transpose(2, 0, 1)
+        im = im[..., :3] if im.ndim == 3 else cv2.cvtColor(im, cv2.COLOR_GRAY2BGR)  # enforce 3ch input
+        s = im.shape[:2]  # HWC
+        g = max(size) / max(s)  # gain
+        im = im if im.data.contiguous else np.ascontiguousarray(im)
+        return im, Path(f).with_suffix(".jpg").name, s, [int(y * g) for y in s]
+
+    def _batches(self, ims, shape1, p, run=None):
+        """Letterboxes loaded images into BCHW tensors, one per shape bucket, returning [(indices, shape, tensor)]."""
+        run = run or (lambda fn, it: list(map(fn, it)))
+        if self.bucket:  # one batch per letterboxed shape, i.e. portrait and landscape scans run separately
+            buckets = {}
+            for i, s in enumerate(shape1):
+                buckets.setdefault(tuple(make_divisible(x, self.stride) for x in s), []).append(i)
+        else:  # single batch padded to the largest shape
+            buckets = {tuple(make_divisible(x, self.stride) for x in np.array(shape1).max(0)): list(range(len(ims)))}
+        batches = []  # (image indices, inference shape, BCHW tensor)
+        for shape, idx in buckets.items():
+            x = np.empty((len(idx), *shape, 3), dtype=np.result_type(*(ims[i].dtype for i in idx)))  # BHWC
+            run(lambda j: self._letterbox_into(x, j, ims[idx[j]], shape), range(len(idx)))  # pad in place
+            x = torch.from_numpy(x).to(p.device).permute(0, 3, 1, 2).contiguous()  # BHWC to BCHW
+            batches.append((idx, shape, x.type_as(p) / 255))  # uint8 to fp16/32
+        return batches
 
-            # Post-process
+    @staticmethod
+    def _letterbox_into(x, j, im, shape):
+        """Writes `im` letterboxed to `shape` into row `j` of the preallocated BHWC buffer `x`."""
+        x[j] = letterbox(im, shape, auto=False)[0]
+
+    def stream(self, source, batch_size=8, size=640, augment=False, queue_size=2):
+        """
+        Yields single-image Detections for an iterable of inputs, in input order, consuming the iterable lazily.
+
+        Pre-processing, inference and NMS run in three threads connected by queues holding at most `queue_size`
+        batches each, so memory stays flat however long the source is. Accepts the file/URI/PIL/numpy inputs of
+        forward(). Usage: for r in model.stream(Path('images').glob('*.jpg'), batch_size=16): r.save()
+        """
+        if isinstance(size, int):  # expand
+            size = (size, size)
+        p = next(self.model.parameters()) if self.pt else torch.empty(1, device=self.model.device)  # param
+        autocast = self.amp and (p.device.type != "cpu")  # Automatic Mixed Precision (AMP) inference
+        stop = threading.Event()  # set when the consumer finishes or abandons the generator
+        q_pre, q_inf, q_out = (queue.Queue(maxsize=max(1, queue_size)) for _ in range(3))
+
+        def put(q, item):
+            while not stop.is_set():
+                with contextlib.suppress(queue.Full):
+                    return q.put(item, timeout=0.1)
+
+        def get(q):
+            while not stop.is_set():
+                with contextlib.suppress(queue.Empty):
+                    return q.get(timeout=0.1)
+
+        @smart_inference_mode()
+        def preprocess():
+            pool = ThreadPool(self.workers) if self.workers > 1 else None
+            run = pool.map if pool else None
+            it, start = iter(source), 0
+            try:
+                while not stop.is_set():
+                    chunk = list(islice(it, batch_size))
+                    if not chunk:
+                        break
+                    dt = (Profile(), Profile(), Profile())
+                    with dt[0]:
+                        loaded = (run or map)(lambda k: self._load(start + k, chunk[k], size), range(len(chunk)))
+                        ims, files, shape0, shape1 = map(list, zip(*loaded))
+                        batches = self._batches(ims, shape1, p, run)
+                    start += len(chunk)
+                    put(q_pre, (ims, files, shape0, batches, dt))
+            finally:
+                if pool:
+                    pool.close()
+
+        @smart_inference_mode()
+        def inference(item):
+            ims, files, shape0, batches, dt = item
+            with amp.autocast(autocast), dt[1]:
+                batches = [(idx, shape, self.model(x, augment=augment)) for idx, shape, x in batches]  # forward
+            return ims, files, shape0, batches, dt
+
+        @smart_inference_mode()
+        def postprocess(item):
+            ims, files, shape0, batches, dt = item
+            y = [None] * len(ims)
             with dt[2]:
-                y = non_max_suppression(
-                    y if self.dmb else y[0],
-                    self.conf,
-                    self.iou,
-                    self.classes,
-                    self.agnostic,
-                    self.multi_label,
-                    max_det=self.max_det,
-                )  # NMS
-                for i in range(n):
-                    scale_boxes(shape1, y[i][:, :4], shape0[i])
+                for idx, shape, pred in batches:
+                    pred = non_max_suppression(
+                        pred if self.dmb else pred[0],
+                        self.conf,
+                        self.iou,
+                        self.classes,
+                        self.agnostic,
+                        self.multi_label,
+                        max_det=self.max_det,
+                    )  # NMS
+                    for i, det in zip(idx, pred):
+                        scale_boxes(shape, det[:, :4], shape0[i])
+                        y[i] = det  # restore input order
+            s = (1, 3, *map(int, np.array([shape for _, shape, _ in batches]).max(0)))  # largest inference shape
+            return ims, files, y, dt, s
+
+        def worker(fn, q_in, q_out):
+            """Runs one stage until its input ends, forwarding the end marker (None) or the first exception."""
+            item = None
+            try:
+                if q_in is None:
+                    fn()  # source stage
+                else:
+                    while (item := get(q_in)) is not None and not isinstance(item, Exception):
+                        put(q_out, fn(item))
+            except Exception as e:
+                item = e
+            put(q_out, item)
+
+        threads = [
+            threading.Thread(target=worker, args=args, daemon=True)
+            for args in ((preprocess, None, q_pre), (inference, q_pre, q_inf), (postprocess, q_inf, q_out))
+        ]
+        for t in threads:
+            t.start()
+        try:
+            while (item := q_out.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                ims, files, y, dt, s = item
+                times = tuple(Profile(t=x.t / len(ims)) for x in dt)  # per-image share of the batch times
+                for i in range(len(ims)):
+                    yield Detections([ims[i]], [y[i]], [files[i]], times, self.names, s).shrink(self.keep_ims)
+        finally:
+            stop.set()
+            for t in threads:
+                t.join()
+
+    def _cache_tag(self):
+        """Returns cache_tag, or when unset a fingerprint of the model (weights path, yaml, names, parameter sums)."""
+        if self.cache_tag:
+            return self.cache_tag
+        if "_model_tag" not in self.__dict__:  # computed once per model
+            params = [x.detach().float() for x in self.model.parameters()] if self.pt else []
+            checksum = sum(float(x.sum()) for x in params)
+            fp = getattr(self.model, "w", ""), getattr(self, "yaml", ""), self.names, len(params), checksum
+            self._model_tag = hashlib.blake2b(str(fp).encode(), digest_size=16).hexdigest()
+        return self._model_tag
+
+    def _forward_cached(self, ims, size, augment, profile):
+        """
+        Runs forward() on images missing from self.cache only, reusing cached detections for the rest.
+
+        Files and URIs are keyed by a hash of their bytes before decoding; with keep_ims=0 cache hits are never decoded.
+        """
+        ims = list(ims) if isinstance(ims, (list, tuple)) else [ims]
+        tag = self.cache.tag(
+            self._cache_tag(),
+            size,
+            self.conf,
+            self.iou,
+            self.classes,
+            self.agnostic,
+            self.multi_label,
+            self.max_det,
+            augment,
+        )
+        files, keys = [], []
+        for i, im in enumerate(ims):
+            f = f"image{i}"
+            if isinstance(im, (str, Path)):  # filename or uri, keyed by the encoded bytes
+                data = requests.get(im).content if str(im).startswith("http") else Path(im).read_bytes()
+                im, f = Image.open(io.BytesIO(data)), im  # lazy, pixels are decoded on first use
+                keys.append(self.cache.key(data, tag))
+            else:
+                if isinstance(im, Image.Image):
+                    im, f = np.asarray(exif_transpose(im)), getattr(im, "filename", f) or f
+                keys.append(self.cache.key(im, tag))
+            files.append(Path(f).with_suffix(".jpg").name)
+            ims[i] = im
+        pred = [self.cache.get(k) for k in keys]
+        first = {}  # key: index of its first miss, duplicates within the call are inferred once
+        miss = [first.setdefault(k, i) for i, (k, x) in enumerate(zip(keys, pred)) if x is None and k not in first]
+
+        shapes = []  # original (h, w)
+        for i, im in enumerate(ims):
+            if isinstance(im, Image.Image) and (first.get(keys[i]) == i or self.keep_ims != 0):
+                im = ims[i] = np.asarray(exif_transpose(im))  # decode
+            if isinstance(im, Image.Image):  # hit with images dropped, shape from the header and EXIF orientation
+                w, h = im.size
+                shapes.append((w, h) if im.getexif().get(0x0112) in (5, 6, 7, 8) else (h, w))
+            else:
+                shapes.append(im.shape[:2])
+
+        p = next(self.model.parameters()) if self.pt else torch.empty(1, device=self.model.device)
+        times, shape = (Profile(), Profile(), Profile()), (0, 3, *((size, size) if isinstance(size, int) else size))
+        if miss:
+            cache, self.cache = self.cache, None  # plain forward() for the misses
+            try:
+                r = self([ims[i] for i in miss], size=size, augment=augment, profile=profile)
+            finally:
+                self.cache = cache
+            for i, x in zip(miss, r.pred):
+                cache.put(keys[i], x)
+                pred[i] = x
+            pred = [x if x is not None else pred[first[k]].clone() for k, x in zip(keys, pred)]  # duplicates
+            times, shape = r.times, r.s
+        pred = [x if isinstance(x, torch.Tensor) else torch.from_numpy(x).to(p.device) for x in pred]
+        return Detections(ims, pred, files, times, self.names, shape, shapes).shrink(self.keep_ims)
 
-            return Detections(ims, y, files, dt, self.names, x.shape)
+    @smart_inference_mode()
+    def tiled(self, ims, tile=640, overlap=0.2, batch_size=8, size=640):
+        """
+        Performs sliced inference on high-resolution images, returning Detections in full-image coordinates.
+
+        Each image is cut into overlapping `tile`x`tile` windows, the windows of all images are inferred `batch_size`
+        at a time at size=tile, and detections are shifted back and merged across seams with merge_tiled_boxes(). A
+        full-frame pass at `size` (0 to skip) is merged in as well, so objects larger than a tile are detected whole.
+        Accepts numpy HWC RGB arrays or PIL images. Usage: tiled(ims, tile=640, overlap=0.2, batch_size=8, size=640)
+        """
+        stride = int(self.stride.max()) if isinstance(self.stride, torch.Tensor) else int(self.stride)
+        if tile < 4 * stride:
+            raise ValueError(f"tile={tile} must be at least 4x the model stride ({4 * stride} pixels)")
+        if not 0 <= overlap <= 0.5:
+            raise ValueError(f"overlap={overlap} must be between 0 and 0.5")
+        ims = list(ims) if isinstance(ims, (list, tuple)) else [ims]
+        ims = [np.asarray(exif_transpose(im)) if isinstance(im, Image.Image) else im for im in ims]
+        step = max(1, int(tile * (1 - overlap)))  # tile stride
+        windows = []  # (image index, x0, y0)
+        for i, im in enumerate(ims):
+            h, w = im.shape[:2]
+            windows += [(i, x0, y0) for y0 in tile_origins(h, tile, step) for x0 in tile_origins(w, tile, step)]
+
+        dt = (Profile(), Profile(), Profile())
+        parts = [[] for _ in ims]  # (window index, detections) per image, -1 for the full-frame pass
+        for k in range(0, len(windows), batch_size):
+            batch = windows[k : k + batch_size]
+            r = self([ims[i][y0 : y0 + tile, x0 : x0 + tile] for i, x0, y0 in batch], size=tile)
+            for p, rt in zip(dt, r.times):
+                p.t += rt.t
+            for j, ((i, x0, y0), pred) in enumerate(zip(batch, r.pred)):
+                pred[:, [0, 2]] += x0  # tile to image coordinates
+                pred[:, [1, 3]] += y0
+                parts[i].append((k + j, pred))
+        if size:
+            r = self(ims, size=size)  # full-frame pass
+            for p, rt in zip(dt, r.times):
+                p.t += rt.t
+            for i, pred in enumerate(r.pred):
+                parts[i].append((-1, pred))
+
+        with dt[2]:
+            pred = []
+            for part in parts:
+                tiles = torch.cat([torch.full((len(x),), k, device=x.device) for k, x in part])
+                pred.append(merge_tiled_boxes(torch.cat([x for _, x in part]), tiles, agnostic=self.agnostic,
+                                              max_det=self.max_det))
+        files = [f"image{i}.jpg" for i in range(len(ims))]
+        s = (len(windows), 3, tile, tile)
+        return Detections(ims, pred, files, dt, self.names, s).shrink(self.keep_ims)
 
 
 class Detections:
     # YOLOv5 detections class for inference results
-    def __init__(self, ims, pred, files, times=(0, 0, 0), names=None, shape=None):
+    def __init__(self, ims, pred, files, times=(0, 0, 0), names=None, shape=None, shapes=None):
         """Initializes the YOLOv5 Detections class with image info, predictions, filenames, timing and normalization."""
         super().__init__()
-        d = pred[0].device  # device
-        gn = [torch.tensor([*(im.shape[i] for i in [1, 0, 1, 0]), 1, 1], device=d) for im in ims]  # normalizations
-        self.ims = ims  # list of images as numpy arrays
+        self.ims = ims  # list of images as numpy arrays, downscaled or None after shrink()
+        self.shapes = shapes or [im.shape[:2] for im in ims]  # original image shapes (h, w)
         self.pred = pred  # list of tensors pred[0] = (xyxy, conf, cls)
         self.names = names  # class names
         self.files = files  # image filenames
         self.times = times  # profiling times
-        self.xyxy = pred  # xyxy pixels
-        self.xywh = [xyxy2xywh(x) for x in pred]  # xywh pixels
-        self.xyxyn = [x / g for x, g in zip(self.xyxy, gn)]  # xyxy normalized
-        self.xywhn = [x / g for x, g in zip(self.xywh, gn)]  # xywh normalized
+        self.xyxy = pred  # xyxy pixels, xywh/xyxyn/xywhn are computed on first access
         self.n = len(self.pred)  # number of images (batch size)
         self.t = tuple(x.t / self.n * 1e3 for x in times)  # timestamps (ms)
         self.s = tuple(shape)  # inference BCHW shape
 
+    @cached_property
+    def gn(self):
+        """Per-image normalization gains [w, h, w, h, 1, 1]."""
+        return [torch.tensor([w, h, w, h, 1, 1], device=x.device) for (h, w), x in zip(self.shapes, self.pred)]
+
+    @cached_property
+    def xywh(self):
+        """Boxes as xywh pixels."""
+        return [xyxy2xywh(x) for x in self.pred]
+
+    @cached_property
+    def xyxyn(self):
+        """Boxes as xyxy normalized by image size."""
+        return [x / g for x, g in zip(self.xyxy, self.gn)]
+
+    @cached_property
+    def xywhn(self):
+        """Boxes as xywh normalized by image size."""
+        return [x / g for x, g in zip(self.xywh, self.gn)]
+
+    def shrink(self, size=0):
+        """
+        Frees retained images: size=0 drops them, size>0 keeps copies downscaled to that longest side, None is a no-op.
+
+        Boxes stay in original pixel coordinates and are scaled when drawing on downscaled images. Returns self.
+        """
+        if size is None:
+            return self
+        ims = []
+        for im, (h, w) in zip(self.ims, self.shapes):
+            r = size / max(h, w)  # downscale ratio
+            if im is not None and 0 < r < 1:
+                im = cv2.resize(im, (max(round(w * r), 1), max(round(h * r), 1)), interpolation=cv2.INTER_AREA)
+            ims.append(im if r > 0 else None)
+        self.ims = ims
+        return self
+
     def _run(self, pprint=False, show=False, save=False, crop=False, render=False, labels=True, save_dir=Path("")):
         """Executes model predictions, displaying and/or saving outputs with optional crops and labels."""
         s, crops = "", []
         for i, (im, pred) in enumerate(zip(self.ims, self.pred)):
-            s += f"\nimage {i + 1}/{len(self.pred)}: {im.shape[0]}x{im.shape[1]} "  # string
+            h, w = self.shapes[i]
+            s += f"\nimage {i + 1}/{len(self.pred)}: {h}x{w} "  # string
+            if im is not None and im.shape[0] != h:  # downscaled by shrink()
+                pred = pred.clone()
+                pred[:, :4] *= im.shape[0] / h
             if pred.shape[0]:
                 for c in pred[:, -1].unique():
                     n = (pred[:, -1] == c).sum()  # detections per class
                     s += f"{n} {self.names[int(c)]}{'s' * (n > 1)}, "  # add to string
                 s = s.rstrip(", ")
-                if show or save or render or crop:
+                if (show or save or render or crop) and im is not None:
                     annotator = Annotator(im, example=str(self.names))
                     for *box, conf, cls in reversed(pred):  # xyxy, confidence, class
                         label = f"{self.names[int(cls)]} {conf:.2f}"
@@ -939,7 +1250,10 @@ class Detections:
             else:
                 s += "(no detections)"
 
-            im = Image.fromarray(im.astype(np.uint8)) if isinstance(im, np.ndarray) else im  # from np
+            if im is None:  # dropped by shrink()
+                continue
+            if show or save:
+                im = Image.fromarray(im.astype(np.uint8)) if isinstance(im, np.ndarray) else im  # from np
             if show:
                 if is_jupyter():
                     from IPython.display import display
@@ -953,7 +1267,7 @@ class Detections:
                 if i == self.n - 1:
                     LOGGER.info(f"Saved {self.n} image{'s' * (self.n > 1)} to {colorstr('bold', save_dir)}")
             if render:
-                self.ims[i] = np.asarray(im)
+                self.ims[i] = im if isinstance(im, np.ndarray) else np.asarray(im)
         if pprint:
             s = s.lstrip("\n")
             return f"{s}\nSpeed: %.1fms pre-process, %.1fms inference, %.1fms NMS per image at shape {self.s}" % self.t
@@ -994,12 +1308,24 @@ class Detections:
         self._run(render=True, labels=labels)  # render results
         return self.ims
 
+    def thumbnails(self, size=640, labels=True):
+        """
+        Renders annotated previews with the longest side at most `size` pixels, drawn on downscaled copies.
+
+        self.ims and self.pred are left untouched. Usage: thumbnails(size=640, labels=True)
+        """
+        new = copy(self).shrink(size)  # downscaled copies, boxes are scaled while drawing
+        new.ims = [im.copy() if im is x and im is not None else im for im, x in zip(new.ims, self.ims)]  # keep self.ims
+        return new.render(labels)
+
     def pandas(self):
         """
         Returns detections as pandas DataFrames for various box formats (xyxy, xyxyn, xywh, xywhn).
 
         Example: print(results.pandas().xyxy[0]).
         """
+        import pandas as pd  # imported on use, serving paths export with numpy()/tojson() instead
+
         new = copy(self)  # return copy
         ca = "xmin", "ymin", "xmax", "ymax", "confidence", "class", "name"  # xyxy columns
         cb = "xcenter", "ycenter", "width", "height", "confidence", "class", "name"  # xywh columns
@@ -1008,6 +1334,62 @@ class Detections:
             setattr(new, k, [pd.DataFrame(x, columns=c) for x in a])
         return new
 
+    def _boxes(self, format):
+        """Returns the per-image (n,6) tensors for box `format` ('xyxy', 'xyxyn', 'xywh' or 'xywhn')."""
+        if format not in ("xyxy", "xyxyn", "xywh", "xywhn"):
+            raise ValueError(f"Invalid box format '{format}', valid formats are xyxy, xyxyn, xywh, xywhn")
+        return getattr(self, format)
+
+    def numpy(self, format="xyxy"):
+        """
+        Returns detections as per-image NumPy structured arrays with the pandas() columns, without importing pandas.
+
+        Example: a = results.numpy()[0]; a['confidence'], a['name']
+        """
+        c = ("xmin", "ymin", "xmax", "ymax") if format.startswith("xyxy") else ("xcenter", "ycenter", "width", "height")
+        out = []
+        for x in self._boxes(format):
+            x = x.float().cpu().numpy()
+            names = [self.names[int(k)] for k in x[:, 5]]
+            dtype = [(k, "f4") for k in c] + [("confidence", "f4"), ("class", "i4")]
+            dtype.append(("name", f"U{max(map(len, names), default=1)}"))
+            a = np.empty(len(x), dtype=dtype)
+            for j, k in enumerate(c):
+                a[k] = x[:, j]
+            a["confidence"], a["class"], a["name"] = x[:, 4], x[:, 5], names
+            out.append(a)
+        return out
+
+    def flat(self, format="xyxy"):
+        """
+        Returns all detections as one (n,7) float32 array [image index, box, conf, cls] for batched export.
+
+        Example: results.flat('xywhn')
+        """
+        x = self._boxes(format)
+        if not x:
+            return np.zeros((0, 7), dtype=np.float32)
+        i = [torch.full((len(p), 1), j, dtype=torch.float32, device=p.device) for j, p in enumerate(x)]
+        i = torch.cat(i)  # image index column
+        return torch.cat((i, torch.cat(x).float()), 1).cpu().numpy()
+
+    def tojson(self, i=None, format="xyxy"):
+        """
+        Encodes detections of image `i` as JSON records with the pandas().xyxy[i].to_json(orient='records') schema.
+
+        Floats are rounded to 10 decimals, as pandas' default double_precision does. With i=None returns a JSON list
+        holding the records of every image. Example: results.tojson(0)
+        """
+        records = [
+            [{k: round(v, 10) if isinstance(v, float) else v for k, v in zip(a.dtype.names, r)} for r in a.tolist()]
+            for a in self.numpy(format)
+        ]
+        return json.dumps(records if i is None else records[i], separators=(",", ":"))
+
+    def tobytes(self, format="xyxy"):
+        """Returns flat() as raw little-endian float32 bytes, decode with np.frombuffer(b, '<f4').reshape(-1, 7)."""
+        return self.flat(format).astype("<f4", copy=False).tobytes()
+
     def tolist(self):
         """
         Converts a Detections object into a list of individual detection results for iteration.
@@ -1023,6 +1405,7 @@ class Detections:
                 self.times,
                 self.names,
                 self.s,
+                [self.shapes[i]],
             )
             for i in r
         ]
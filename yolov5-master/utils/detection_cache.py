@@ -0,0 +1,108 @@
+# Ultralytics YOLOv5 🚀, AGPL-3.0 license
+"""Persistent detection cache keyed by image content, for skipping inference on duplicate images."""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+class DetectionCache:
+    """
+    On-disk store of detections keyed by a content hash of the image plus a model/settings tag.
+
+    Entries are (n,6) float32 arrays [xyxy, conf, cls] kept in a single SQLite file. When the stored payload exceeds
+    `max_bytes`, least recently used entries are evicted. Safe to share between threads.
+
+    Usage:
+        cache = DetectionCache('runs/cache/detections.db', max_bytes=256 << 20)
+        key = cache.key(open('image.jpg', 'rb').read(), tag)
+        pred = cache.get(key)  # None on miss
+        cache.put(key, pred)
+    """
+
+    def __init__(self, path="detections.db", max_bytes=256 << 20):
+        """Opens or creates the cache database at `path`, evicting entries beyond `max_bytes` of payload."""
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS detections (key TEXT PRIMARY KEY, pred BLOB, size INTEGER, atime REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS detections_atime ON detections (atime)")
+        self._db.commit()
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM detections").fetchone()[0]
+
+    @staticmethod
+    def tag(*parts):
+        """Builds a model/settings tag, e.g. tag(model_hash, conf, iou, size); any change invalidates old entries."""
+        return "|".join(str(p) for p in parts)
+
+    @staticmethod
+    def key(data, tag=""):
+        """Returns the cache key of encoded image bytes or a decoded numpy image under `tag`."""
+        h = hashlib.blake2b(digest_size=20)
+        if isinstance(data, np.ndarray):
+            data = np.ascontiguousarray(data)
+            h.update(str((data.shape, data.dtype.str)).encode())
+        h.update(memoryview(data).cast("B"))
+        h.update(tag.encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        """Returns the cached (n,6) float32 array for `key`, or None on a miss."""
+        with self._lock:
+            row = self._db.execute("SELECT pred FROM detections WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE detections SET atime = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        return np.frombuffer(row[0], dtype=np.float32).reshape(-1, 6).copy()
+
+    def put(self, key, pred):
+        """Stores an (n,6) [xyxy, conf, cls] array or tensor under `key` and evicts old entries if over budget."""
+        if hasattr(pred, "cpu"):
+            pred = pred.cpu().numpy()
+        blob = np.ascontiguousarray(pred, dtype=np.float32).reshape(-1, 6).tobytes()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM detections WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO detections (key, pred, size, atime) VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), time.time()),
+            )
+            self._size += len(blob) - (old[0] if old else 0)
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """Deletes least recently used entries until the payload fits in max_bytes; caller holds the lock."""
+        while self._size > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM detections ORDER BY atime LIMIT 256").fetchall()
+            if not rows:
+                self._size = 0
+                break
+            for key, size in rows:
+                self._db.execute("DELETE FROM detections WHERE key = ?", (key,))
+                self._size -= size
+                if self._size <= self.max_bytes:
+                    break
+
+    def clear(self):
+        """Removes all entries."""
+        with self._lock:
+            self._db.execute("DELETE FROM detections")
+            self._db.commit()
+            self._size = 0
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._db.close()
@@ -3,6 +3,7 @@
 
 import argparse
 import io
+from pathlib import Path
 
 import torch
 from flask import Flask, request
@@ -12,6 +13,7 @@ app = Flask(__name__)
 models = {}
 
 DETECTION_URL = "/v1/object-detection/<model>"
+ROOT = Path(__file__).resolve().parents[2]  # YOLOv5 root directory, hubconf.py
 
 
 @app.route(DETECTION_URL, methods=["POST"])
@@ -34,7 +36,7 @@ def predict(model):
 
         if model in models:
             results = models[model](im, size=640)  # reduce size=320 for faster inference
-            return results.pandas().xyxy[0].to_json(orient="records")
+            return results.tojson(0)  # JSON records without building pandas DataFrames
 
 
 if __name__ == "__main__":
@@ -44,6 +46,6 @@ if __name__ == "__main__":
     opt = parser.parse_args()
 
     for m in opt.model:
-        models[m] = torch.hub.load("ultralytics/yolov5", m, force_reload=True, skip_validation=True)
+        models[m] = torch.hub.load(str(ROOT), m, source="local")  # local repo, provides Detections.tojson()
 
     app.run(host="0.0.0.0", port=opt.port)  # debug=True causes Restarting with stat
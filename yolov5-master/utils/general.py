@@ -1120,6 +1120,54 @@ def non_max_suppression(
     return output
 
 
+def tile_origins(length, tile, step):
+    """Returns start offsets of `tile`-sized windows spaced `step` apart that cover [0, length), last one flush."""
+    if length <= tile:
+        return [0]
+    return list(range(0, length - tile, step)) + [length - tile]
+
+
+def merge_tiled_boxes(pred, tiles=None, ios_thres=0.25, agnostic=False, max_det=300):
+    """
+    Merges detections from overlapping windows given as an (n,6) tensor [xyxy, conf, cls] in image coordinates.
+
+    Greedy non-maximum merging (as in SAHI): in order of decreasing confidence, each box absorbs the remaining
+    same-class boxes whose intersection over the smaller box exceeds ios_thres and is replaced by their union, so
+    parts of an object cut by a tile seam become one box. `tiles` (n,) gives the source window of each box; boxes
+    from the same window are never merged with each other.
+    """
+    if not pred.shape[0]:
+        return pred
+    i = pred[:, 4].argsort(descending=True)  # decreasing confidence
+    pred = pred[i]
+    boxes = pred[:, :4]
+
+    # Intersection over the smaller box area
+    (a1, a2), (b1, b2) = boxes.unsqueeze(1).chunk(2, 2), boxes.unsqueeze(0).chunk(2, 2)
+    inter = (torch.min(a2, b2) - torch.max(a1, b1)).clamp(0).prod(2)
+    area = (boxes[:, 2:] - boxes[:, :2]).prod(1)
+    match = inter / torch.min(area[:, None], area[None]).clamp(min=1e-7) > ios_thres  # [i, j]: j merges into i
+    if not agnostic:
+        match &= pred[:, None, 5] == pred[None, :, 5]  # same class
+    if tiles is not None:
+        tiles = tiles[i]
+        match &= tiles[:, None] != tiles[None]  # different windows
+    match.fill_diagonal_(True)
+
+    free = torch.ones(len(pred), dtype=torch.bool, device=pred.device)  # boxes not merged yet
+    output = []
+    for i in range(len(pred)):
+        if not free[i]:
+            continue
+        j = match[i] & free
+        free &= ~j
+        b = pred[j, :4]
+        output.append(torch.cat((b[:, :2].min(0).values, b[:, 2:].max(0).values, pred[i, 4:])))  # union, conf, cls
+        if len(output) == max_det:
+            break
+    return torch.stack(output)
+
+
 def strip_optimizer(f="best.pt", s=""):
     """
     Strips optimizer and optionally saves checkpoint to finalize training; arguments are file path 'f' and save path